@@ -0,0 +1,96 @@
+import argparse
+import os
+import tempfile
+import time
+from zoneinfo import ZoneInfo
+
+from benchmarks.synthetic_db import cached_database
+from src.exporter import render_phrases
+from src.templates import load_templates
+
+# Compares the compiled templates with the hard-coded f-strings they replaced,
+# both driven through render_phrases so only the rendering differs.
+#
+#   python -m benchmarks.render_templates --rows 1000000
+
+
+def legacy_front_matter(book_names, date_values):
+    lines = ["---\n", "tags:\n  - english-learning\n  - reading\n", "book:\n"]
+    lines.extend(f'  - "{b}"\n' for b in book_names)
+    lines.append(f"dates: {', '.join(date_values)}\n")
+    lines.append("pages:\n---\n")
+    return "".join(lines)
+
+
+class LegacyTemplates:
+    # The pre-template renderer: hard-coded f-strings called per row.
+
+    front_matter = staticmethod(legacy_front_matter)
+
+    @staticmethod
+    def book_header(book_val):
+        return f"\n# {book_val}\n"
+
+    @staticmethod
+    def entry(book_val, word, phrase, local_date):
+        return f"## {word}\n> [!note] Context\n> {phrase}\n"
+
+
+def render(db_path, per_book, per_date, user_timezone, templates):
+    return sum(
+        len(chunk)
+        for _, chunk in render_phrases(
+            db_path,
+            [],
+            None,
+            per_book,
+            per_date,
+            None,
+            user_timezone,
+            templates=templates,
+        )
+    )
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    size = func(*args)
+    return time.perf_counter() - started, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--cache", default=os.path.join(tempfile.gettempdir(), "vocab-bench")
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.cache, exist_ok=True)
+    db_path = cached_database(args.cache, args.rows)
+    user_timezone = ZoneInfo("Europe/Berlin")
+
+    print(f"{args.rows} rows, best of {args.repeat}")
+    for per_book, per_date in ((False, False), (True, False), (False, True)):
+        results = {}
+        for name, templates in (
+            ("legacy", LegacyTemplates),
+            ("templates", load_templates()),
+        ):
+            runs = [
+                timed(render, db_path, per_book, per_date, user_timezone, templates)
+                for _ in range(args.repeat)
+            ]
+            results[name] = min(runs)
+        legacy, compiled = results["legacy"][0], results["templates"][0]
+        print(
+            f"per_book={per_book!s:5} per_date={per_date!s:5}  "
+            f"legacy {legacy:6.2f}s ({args.rows / legacy:9,.0f} rows/s)  "
+            f"templates {compiled:6.2f}s ({args.rows / compiled:9,.0f} rows/s)  "
+            f"{legacy / compiled:4.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from benchmarks.synthetic_db import SIZES, cached_database, parse_range, parse_size
+
+# Runs each scenario in a fresh interpreter so peak RSS belongs to that
+# scenario alone, and writes the results to a JSON file:
+#
+#   python -m benchmarks.run --sizes 10k 100k -o before.json
+#   python -m benchmarks.run --sizes 10k 100k -o after.json --compare before.json
+
+TIMEZONE = "Europe/Berlin"
+PREVIEW_PAGE = 200
+# The merged scenario spreads the same row count over this many device
+# databases, so it compares directly with the single-database export.
+MERGED_DEVICES = 2
+# A phrase and a prefix term, matching a few percent of the synthetic lookups.
+SEARCH = '"morning silence" OR word: garden*'
+
+
+def export_scenario(**options):
+    from src.exporter import export_phrases
+
+    def run(db_path):
+        output_dir = tempfile.mkdtemp(prefix="vocab-bench-")
+        try:
+            files, error = export_phrases(
+                db_path,
+                output_dir,
+                [],
+                None,
+                True,
+                user_timezone=ZoneInfo(TIMEZONE),
+                **options,
+            )
+            if error:
+                raise RuntimeError(error)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    return run
+
+
+def preview_scenario(db_path):
+    # Opening the preview plans every file and shows the first page of the
+    # first one; the sidebar then pages through the others on demand.
+    from src.exporter import PreviewPages
+
+    pages = PreviewPages(db_path, [], None, user_timezone=ZoneInfo(TIMEZONE))
+    for index in range(min(len(pages.groups), 20)):
+        pages.render(index, 0, PREVIEW_PAGE)
+        pages.render(index, PREVIEW_PAGE, PREVIEW_PAGE)
+
+
+def search_index_scenario(db_path):
+    # Builds the full-text index from scratch, as the first search does.
+    from src.search import index_path, update_index
+
+    path = index_path(db_path)
+    if os.path.exists(path):
+        os.remove(path)
+    update_index(db_path)
+
+
+def catalog_scenario(db_path):
+    from src.catalog import Catalog
+
+    catalog = Catalog.build(db_path, ZoneInfo(TIMEZONE))
+    catalog.dates()
+    for book in catalog.books()[:10]:
+        catalog.dates(book)
+    catalog.books(list(catalog.dates())[:31])
+
+
+SCENARIOS = {
+    "export": export_scenario(),
+    "export_per_book": export_scenario(per_book=True),
+    "export_per_date": export_scenario(per_date=True),
+    "export_book_date": export_scenario(per_book=True, per_date=True),
+    "export_merged": export_scenario(),
+    "export_aggregate": export_scenario(per_book=True, aggregate=True),
+    "export_ndjson": export_scenario(output_format="ndjson"),
+    "export_csv": export_scenario(output_format="csv"),
+    "export_anki": export_scenario(output_format="anki"),
+    "search_index": search_index_scenario,
+    "export_search": export_scenario(per_book=True, search=SEARCH),
+    "preview": preview_scenario,
+    "catalog": catalog_scenario,
+}
+
+
+def peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_child(scenario, db_path):
+    if os.pathsep in db_path:
+        db_path = db_path.split(os.pathsep)
+    started = time.perf_counter()
+    SCENARIOS[scenario](db_path)
+    seconds = time.perf_counter() - started
+    print(json.dumps({"seconds": seconds, "peak_rss_kb": peak_rss_kb()}))
+
+
+def measure(scenario, db_path, rows, repeat):
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.run", "--child", scenario, db_path],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    seconds = min(run["seconds"] for run in runs)
+    rss = [run["peak_rss_kb"] for run in runs if run["peak_rss_kb"] is not None]
+    return {
+        "scenario": scenario,
+        "rows": rows,
+        "seconds": seconds,
+        "runs": [run["seconds"] for run in runs],
+        "peak_rss_kb": max(rss) if rss else None,
+        "rows_per_sec": rows / seconds if seconds else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(result, baseline=None):
+    rss = result["peak_rss_kb"]
+    line = (
+        f"{result['scenario']:16} {result['rows']:>9}  "
+        f"{result['seconds']:8.3f}s  {result['rows_per_sec']:>12,.0f} rows/s  "
+        f"{(rss or 0) / 1024:7.1f} MiB"
+    )
+    if baseline:
+        speedup = baseline["seconds"] / result["seconds"]
+        rss_change = ""
+        if rss and baseline.get("peak_rss_kb"):
+            rss_change = f", RSS {rss / baseline['peak_rss_kb'] - 1:+.0%}"
+        line += f"  ({speedup:.2f}x{rss_change})"
+    print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the exporter.")
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=parse_size,
+        default=[SIZES["10k"], SIZES["100k"]],
+        help="database sizes in rows, or 10k/100k/1m",
+    )
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS)
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario")
+    parser.add_argument("--books", type=int, default=50)
+    parser.add_argument("--days", type=int, default=3 * 365)
+    parser.add_argument(
+        "--context-words", type=parse_range, default=(6, 18), metavar="MIN-MAX"
+    )
+    # Repeated lookups of a word are what the aggregate scenario merges.
+    parser.add_argument("--repeats", type=float, default=0.1)
+    parser.add_argument("-o", "--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    parser.add_argument(
+        "--cache",
+        default=os.path.join(tempfile.gettempdir(), "vocab-bench"),
+        help="folder for the generated databases",
+    )
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            for result in json.load(f)["results"]:
+                baseline[result["scenario"], result["rows"]] = result
+
+    results = []
+    for rows in args.sizes:
+        db_path = cached_database(
+            args.cache,
+            rows,
+            books=args.books,
+            days=args.days,
+            context_words=args.context_words,
+            repeats=args.repeats,
+        )
+        for scenario in args.scenarios:
+            if scenario == "export_merged":
+                path = os.pathsep.join(
+                    cached_database(
+                        args.cache,
+                        rows // MERGED_DEVICES,
+                        books=args.books,
+                        days=args.days,
+                        context_words=args.context_words,
+                        repeats=args.repeats,
+                        seed=device + 1,
+                    )
+                    for device in range(MERGED_DEVICES)
+                )
+            else:
+                path = db_path
+            result = measure(scenario, path, rows, args.repeat)
+            print_result(result, baseline.get((scenario, rows)))
+            results.append(result)
+
+    if args.output:
+        report = {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "database": {
+                "books": args.books,
+                "days": args.days,
+                "context_words": list(args.context_words),
+                "repeats": args.repeats,
+            },
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Checks the GUI's startup against a budget: the time spent importing
+# modules, from `python -X importtime`, and the wall time from launching
+# main.py to the first paint of its window. Exits with status 1 when a
+# budget is exceeded or a module meant to load on first use is imported
+# on the way to the first paint:
+#
+#   python -m benchmarks.startup
+#   python -m benchmarks.startup --import-budget 200 --paint-budget 600
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_BUDGET_MS = 300
+PAINT_BUDGET_MS = 1000
+# Imported when a database is picked, the filter panel is opened, or a
+# preview or export runs.
+LAZY_MODULES = (
+    "sqlite3",
+    "concurrent.futures",
+    "src.catalog",
+    "src.database",
+    "src.date_selector",
+    "src.exporter",
+    "src.jobs",
+    "src.preview",
+    "src.templates",
+)
+
+# Runs main.py as it starts normally, except that mainloop() paints the
+# window once, prints the time and closes it. Without a display only the
+# module imports of main.py run. Kept to a -c snippet so this script's
+# own imports are not counted.
+PROBE = """
+import time, tkinter
+if {paint}:
+    def first_paint(self, n=0):
+        self.update()
+        print(time.time())
+        self.destroy()
+    tkinter.Misc.mainloop = first_paint
+with open("main.py") as f:
+    exec(compile(f.read(), "main.py", "exec"), {{"__name__": {run_name!r}}})
+"""
+
+
+def has_display():
+    if sys.platform in ("win32", "darwin"):
+        return True
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+def parse_importtime(stderr):
+    # Returns the cumulative microseconds of each top-level import and the
+    # names of every module imported.
+    top_level = {}
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        try:
+            cumulative = int(cumulative)
+        except ValueError:
+            continue
+        modules.add(name.strip())
+        if not name[1:].startswith(" "):
+            top_level[name.strip()] = cumulative
+    return top_level, modules
+
+
+def measure(paint):
+    started = time.time()
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            PROBE.format(paint=paint, run_name="__main__" if paint else "main"),
+        ],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    top_level, modules = parse_importtime(result.stderr)
+    paint_ms = None
+    if paint:
+        paint_ms = (float(result.stdout.splitlines()[-1]) - started) * 1000
+    return {
+        "import_ms": sum(top_level.values()) / 1000,
+        "paint_ms": paint_ms,
+        "top_level": top_level,
+        "modules": modules,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the GUI's startup time.")
+    parser.add_argument(
+        "--import-budget", type=float, default=IMPORT_BUDGET_MS, metavar="MS"
+    )
+    parser.add_argument(
+        "--paint-budget", type=float, default=PAINT_BUDGET_MS, metavar="MS"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="runs to take the best of"
+    )
+    parser.add_argument(
+        "--no-paint",
+        dest="paint",
+        action="store_false",
+        help="only measure imports, e.g. without a display",
+    )
+    args = parser.parse_args(argv)
+    paint = args.paint and has_display()
+
+    try:
+        runs = [measure(paint) for _ in range(args.repeat)]
+    except RuntimeError as e:
+        print(f"startup failed: {e}", file=sys.stderr)
+        return 1
+    best = min(runs, key=lambda run: run["import_ms"])
+
+    failures = []
+    import_ms = best["import_ms"]
+    print(f"imports      {import_ms:8.1f} ms  (budget {args.import_budget:.0f} ms)")
+    if import_ms > args.import_budget:
+        failures.append("imports over budget")
+    if paint:
+        paint_ms = min(run["paint_ms"] for run in runs)
+        print(f"first paint  {paint_ms:8.1f} ms  (budget {args.paint_budget:.0f} ms)")
+        if paint_ms > args.paint_budget:
+            failures.append("first paint over budget")
+    else:
+        print("first paint  skipped, no display")
+
+    slowest = sorted(best["top_level"].items(), key=lambda item: -item[1])[:8]
+    print(
+        "slowest: " + ", ".join(f"{name} {us / 1000:.1f} ms" for name, us in slowest)
+    )
+    eager = [name for name in LAZY_MODULES if name in best["modules"]]
+    if eager:
+        failures.append("imported at startup: " + ", ".join(eager))
+
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import argparse
+import os
+import random
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE "vocabulary" (
+    "word" TEXT NOT NULL UNIQUE,
+    "title_id" INTEGER,
+    "create_time" INTEGER NOT NULL,
+    "review_time" INTEGER,
+    "due_time" INTEGER NOT NULL,
+    "review_count" INTEGER NOT NULL DEFAULT 0,
+    "prev_context" TEXT,
+    "next_context" TEXT,
+    "streak_count" INTEGER NOT NULL DEFAULT 0,
+    "highlight" TEXT,
+    PRIMARY KEY("word")
+);
+CREATE TABLE "title" (
+    "id" INTEGER NOT NULL UNIQUE,
+    "name" TEXT UNIQUE,
+    "filter" INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY("id" AUTOINCREMENT)
+);
+"""
+START_TIME = 1_600_000_000
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+FILLER = (
+    "the of and to in that was he she it with as his her for on had at by "
+    "which but from they you were this not all one been would there their "
+    "said could when into more some only over such after very what about "
+    "through window river morning silence letter garden stranger shadow"
+).split()
+
+
+def make_database(
+    path,
+    rows,
+    books=50,
+    days=3 * 365,
+    context_words=(6, 18),
+    seed=1,
+    repeats=0.0,
+):
+    # Builds a KOReader-shaped vocabulary database. Lookups come in reading
+    # sessions: a session picks a book (a few books get most of the
+    # reading), a day and an evening hour, then looks up a handful of words
+    # minutes apart. About one lookup in fifty has no title row, like books
+    # removed from the device. Context on each side is context_words long.
+    # A repeats share of the lookups is a word looked up before in the same
+    # book, mostly on another day; KOReader keeps one row per spelling, so a
+    # repeat is written in another case (as at the start of a sentence).
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    low, high = context_words
+    weights = [1 / (rank + 1) for rank in range(books)]
+
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany(
+        "INSERT INTO title (name) VALUES (?)",
+        [(f"Book {i:04d}: {rng.choice(FILLER).title()}",) for i in range(books)],
+    )
+
+    def context():
+        return " ".join(rng.choices(FILLER, k=rng.randint(low, high)))
+
+    seen = {}
+
+    def next_word(title_id, written):
+        earlier = seen.setdefault(title_id, [])
+        if earlier and rng.random() < repeats:
+            index = rng.randrange(len(earlier))
+            _, spellings = earlier[index]
+            if spellings:
+                return spellings.pop()
+            earlier[index] = earlier[-1]
+            earlier.pop()
+        word = f"{rng.choice(FILLER)}{written}"
+        if repeats:
+            earlier.append((word, [word.upper(), word.capitalize()]))
+        return word
+
+    def lookups():
+        written = 0
+        while written < rows:
+            title_id = rng.choices(range(1, books + 1), weights)[0]
+            if rng.random() < 0.02:
+                title_id = books + 1
+            when = (
+                START_TIME
+                + rng.randrange(days) * 86400
+                + rng.randint(17, 23) * 3600
+                + rng.randrange(3600)
+            )
+            for _ in range(min(rng.randint(1, 20), rows - written)):
+                word = next_word(title_id, written)
+                when += rng.randint(20, 600)
+                yield (
+                    word,
+                    title_id,
+                    when,
+                    when + 86400,
+                    context(),
+                    context(),
+                    None if rng.random() < 0.75 else word.upper(),
+                )
+                written += 1
+
+    conn.executemany(
+        "INSERT INTO vocabulary (word, title_id, create_time, due_time,"
+        " prev_context, next_context, highlight) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        lookups(),
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+def cached_database(directory, rows, **kwargs):
+    # Generated databases are deterministic, so they are reused between runs
+    # as long as the generator settings in the name match.
+    settings = "".join(
+        f"-{key}{'_'.join(map(str, value)) if isinstance(value, tuple) else value}"
+        for key, value in sorted(kwargs.items())
+    )
+    path = os.path.join(directory, f"vocabulary-{rows}{settings}.sqlite3")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        make_database(path + ".tmp", rows, **kwargs)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def parse_size(value):
+    if value.lower() in SIZES:
+        return SIZES[value.lower()]
+    return int(value)
+
+
+def parse_range(value):
+    low, _, high = value.partition("-")
+    return int(low), int(high or low)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic KOReader vocabulary database."
+    )
+    parser.add_argument("path")
+    parser.add_argument(
+        "--rows", type=parse_size, default=100_000, help="row count, or 10k/100k/1m"
+    )
+    parser.add_argument("--books", type=int, default=50)
+    parser.add_argument("--days", type=int, default=3 * 365)
+    parser.add_argument(
+        "--context-words",
+        type=parse_range,
+        default=(6, 18),
+        metavar="MIN-MAX",
+        help="words of context on each side of a lookup",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--repeats",
+        type=float,
+        default=0.1,
+        help="share of lookups that repeat an earlier word of the same book",
+    )
+    args = parser.parse_args(argv)
+    make_database(
+        args.path,
+        args.rows,
+        books=args.books,
+        days=args.days,
+        context_words=args.context_words,
+        seed=args.seed,
+        repeats=args.repeats,
+    )
+
+
+if __name__ == "__main__":
+    main()
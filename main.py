@@ -1,9 +1,19 @@
+import logging
+import multiprocessing
 import ttkbootstrap as ttk
-import atexit
+from src.config import load_theme
+from src.instrumentation import enable_from_environment
 from src.ui import SQLitePhraseExporter
 
 if __name__ == "__main__":
-    root = ttk.Window(themename="darkly")
+    # Large exports render in worker processes, which a frozen build
+    # starts by running this executable again.
+    multiprocessing.freeze_support()
+    logging.basicConfig(
+        level=logging.ERROR, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    enable_from_environment()
+    # Built in the saved theme, so it is not restyled before the first paint.
+    root = ttk.Window(themename=load_theme())
     app = SQLitePhraseExporter(root)
-    atexit.register(app.cleanup_cache)
     root.mainloop()
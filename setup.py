@@ -6,11 +6,16 @@ setup(
     packages=find_packages(),
     install_requires=[
         "ttkbootstrap",
+        "tzdata",
+        "tzlocal>=5",
         # add other dependencies here
     ],
-    entry_points={"gui_scripts": ["vocab-builder-to-md = main:main"]},
+    entry_points={
+        "gui_scripts": ["vocab-builder-to-md = main:main"],
+        "console_scripts": ["vocab-builder-to-md-cli = src.cli:main"],
+    },
     include_package_data=True,
-    package_data={"": ["src/icon.ico"]},
+    package_data={"": ["src/icon.ico", "src/templates/*.md"]},
     author="Your Name",
     description="Vocabulary Builder Exporter",
 )
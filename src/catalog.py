@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+from collections import defaultdict
+
+from src.config import cache_dir
+from src.database import database_key, database_paths, get_database
+from src.export_manifest import timezone_name
+from src.filters import build_day_buckets, vocabulary_source
+from src.instrumentation import span
+from src.worker import cancellable
+
+CATALOG_VERSION = 1
+
+
+def _cache_path(db_path):
+    key = "\n".join(database_key(db_path))
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir(), f"catalog-{digest}.json")
+
+
+def _cache_key(db_path, user_timezone):
+    stats = [os.stat(path) for path in database_paths(db_path)]
+    return {
+        "version": CATALOG_VERSION,
+        "size": stats[0].st_size,
+        "mtime": stats[0].st_mtime_ns,
+        "merged": [[stat.st_size, stat.st_mtime_ns] for stat in stats[1:]],
+        "timezone": timezone_name(user_timezone),
+    }
+
+
+class Catalog:
+    def __init__(self, rows):
+        # rows are (book, local_day, count) with book None for lookups whose
+        # title is missing from the title table.
+        self.rows = rows
+        self.days_by_book = defaultdict(lambda: defaultdict(int))
+        self.all_days = defaultdict(int)
+        self.books_by_day = defaultdict(set)
+        for book, day, count in rows:
+            self.days_by_book[book][day] += count
+            self.all_days[day] += count
+            if book is not None:
+                self.books_by_day[day].add(book)
+
+    @classmethod
+    def build(cls, db_path, user_timezone=None, cancelled=None):
+        database = get_database(db_path)
+        with span("catalog.build"), database.connect() as conn:
+            cancellable(conn, cancelled)
+            try:
+                cursor = conn.cursor()
+                buckets = build_day_buckets(cursor, user_timezone, database.schemas)
+                cursor.execute(
+                    f"""
+                    SELECT b.name, {buckets.sql()} AS day, COUNT(*)
+                    FROM {vocabulary_source(database.schemas)}
+                    WHERE a.create_time IS NOT NULL
+                    GROUP BY b.name, day
+                    """
+                )
+                return cls(
+                    [
+                        (book, buckets.name(day), count)
+                        for book, day, count in cursor.fetchall()
+                    ]
+                )
+            finally:
+                cancellable(conn, None)
+
+    @classmethod
+    def load(cls, db_path, user_timezone=None, cancelled=None):
+        key = _cache_key(db_path, user_timezone)
+        path = _cache_path(db_path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("key") == key:
+                return cls([tuple(row) for row in cached["rows"]])
+        except (OSError, json.JSONDecodeError, KeyError, TypeError):
+            pass
+
+        catalog = cls.build(db_path, user_timezone, cancelled)
+        try:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "rows": catalog.rows}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+        return catalog
+
+    def dates(self, book=None):
+        if book and book != "(All)":
+            days = self.days_by_book.get(book, {})
+        else:
+            days = self.all_days
+        return dict(sorted(days.items()))
+
+    def books(self, selected_dates=None):
+        if not selected_dates:
+            return sorted(b for b in self.days_by_book if b is not None)
+        books = set()
+        for day in selected_dates:
+            books |= self.books_by_day.get(day, set())
+        return sorted(books)
@@ -0,0 +1,410 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from src.database import database_paths, open_database
+from src import instrumentation
+from src.exporter import export_phrases
+from src.sinks import RECORD_FORMATS
+from src.templates import load_templates
+from src.timezones import local_timezone
+from src.watcher import DatabaseWatcher, watch
+
+JOB_OPTIONS = (
+    "book",
+    "dates",
+    "date_from",
+    "date_to",
+    "per_book",
+    "per_date",
+    "include_tags",
+    "timezone",
+    "folder_name",
+    "incremental",
+    "snapshot",
+    "templates",
+    "aggregate",
+    "format",
+    "search",
+)
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{value}', expected YYYY-MM-DD")
+
+
+def expand_dates(dates=None, date_from=None, date_to=None):
+    selected = set(dates or ())
+    if date_from or date_to:
+        if not (date_from and date_to):
+            raise ValueError("a date range needs both a start and an end date")
+        start = date.fromisoformat(str(date_from))
+        end = date.fromisoformat(str(date_to))
+        if end < start:
+            raise ValueError(f"date range ends before it starts: {start} > {end}")
+        while start <= end:
+            selected.add(start.isoformat())
+            start += timedelta(days=1)
+    return sorted(str(d) for d in selected)
+
+
+def resolve_timezone(name):
+    if not name:
+        return local_timezone()
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"unknown timezone '{name}'")
+
+
+def check_databases(db):
+    # Before anything is written: exports fail on a missing database only
+    # after creating their output folder.
+    for path in database_paths(db):
+        if not os.path.isfile(path):
+            raise ValueError(f"no such database: {path}")
+
+
+def run_job(job):
+    started = time.perf_counter()
+    summary = {
+        "db": job["db"],
+        "output": job["output"],
+        "files": [],
+        "stats": {},
+        "error": None,
+        "dry_run": bool(job.get("dry_run")),
+    }
+    if job.get("trace"):
+        instrumentation.enable()
+    try:
+        dates = expand_dates(
+            job.get("dates"), job.get("date_from"), job.get("date_to")
+        )
+        if job.get("snapshot"):
+            open_database(job["db"], snapshot=True)
+        files, error = export_phrases(
+            job["db"],
+            job["output"],
+            dates,
+            job.get("book"),
+            True,
+            per_book=bool(job.get("per_book")),
+            per_date=bool(job.get("per_date")),
+            custom_folder_name=job.get("folder_name"),
+            user_timezone=resolve_timezone(job.get("timezone")),
+            include_tags=job.get("include_tags", True),
+            incremental=bool(job.get("incremental")),
+            template_dir=job.get("templates"),
+            stats=summary["stats"],
+            workers=job.get("workers"),
+            aggregate=bool(job.get("aggregate")),
+            output_format=job.get("format") or "markdown",
+            search=job.get("search"),
+            dry_run=bool(job.get("dry_run")),
+        )
+        summary["files"] = files or []
+        summary["error"] = error
+    except Exception as e:
+        summary["error"] = str(e)
+    summary["seconds"] = time.perf_counter() - started
+    if job.get("trace"):
+        summary["trace"] = instrumentation.collect()
+    return summary
+
+
+def load_manifest(path, defaults):
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    entries = manifest.get("jobs", []) if isinstance(manifest, dict) else manifest
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    if not isinstance(entries, list):
+        raise ValueError(f"{path} needs a list of jobs")
+
+    jobs = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"job #{index + 1} in {path} is not an object")
+        if "db" not in entry or "output" not in entry:
+            raise ValueError(f"job #{index + 1} in {path} needs 'db' and 'output'")
+        dates = entry.get("dates")
+        if dates is not None and not (
+            isinstance(dates, list) and all(isinstance(d, str) for d in dates)
+        ):
+            raise ValueError(
+                f"job #{index + 1} in {path} needs 'dates' as a list of dates"
+            )
+        job = dict(defaults)
+        job.update({k: v for k, v in entry.items() if k in JOB_OPTIONS})
+        if isinstance(entry["db"], list):
+            job["db"] = [os.path.join(base_dir, db) for db in entry["db"]]
+        else:
+            job["db"] = os.path.join(base_dir, entry["db"])
+        job["output"] = os.path.join(base_dir, entry["output"])
+        if entry.get("templates"):
+            job["templates"] = os.path.join(base_dir, entry["templates"])
+        jobs.append(job)
+    return jobs
+
+
+def run_jobs(jobs, workers=None):
+    # A single export spreads its files over the workers itself; several
+    # jobs run one per worker and render in-process.
+    if len(jobs) == 1:
+        yield run_job(dict(jobs[0], workers=workers))
+        return
+    jobs = [dict(job, workers=1) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        yield from pool.map(run_job, jobs)
+
+
+def watch_jobs(jobs, report, workers=None):
+    # Exports each job again whenever its database changes, until
+    # interrupted. The exports are incremental, so each one only appends
+    # the lookups made since the last.
+    watchers = []
+    for job in jobs:
+
+        def export(db_path, job=job):
+            report(run_job(dict(job, db=db_path, incremental=True, workers=workers)))
+
+        watchers.append(DatabaseWatcher(job["db"], export))
+    try:
+        watch(watchers, threading.Event())
+    except KeyboardInterrupt:
+        pass
+
+
+def print_summary(summary):
+    db = summary["db"]
+    if isinstance(db, list):
+        db = " + ".join(db)
+    if summary["error"]:
+        print(f"FAILED  {db}: {summary['error']}", file=sys.stderr)
+    elif summary.get("dry_run"):
+        stats = summary["stats"]
+        print(
+            f"PLAN    {db} -> {summary['output']} "
+            f"({len(summary['files'])} files, {stats['total_rows']} lookups)"
+        )
+        for path in summary["files"]:
+            print(f"        {os.path.relpath(path, summary['output'])}")
+    else:
+        stats = summary["stats"]
+        print(
+            f"OK      {db} -> {summary['output']} "
+            f"({len(summary['files'])} files: {stats['written']} written, "
+            f"{stats['unchanged']} unchanged, {stats['deleted']} deleted; "
+            f"{summary['seconds']:.2f}s)"
+        )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="vocab-builder-to-md-cli",
+        description="Export KOReader vocabulary builder databases to Markdown.",
+    )
+    parser.add_argument(
+        "db",
+        nargs="*",
+        help="vocabulary builder SQLite database; several are merged into one export."
+        " With --watch, may be the folder a device is mounted at",
+    )
+    parser.add_argument("-o", "--output", help="output folder")
+    parser.add_argument(
+        "-m",
+        "--manifest",
+        help="JSON job manifest listing databases and output folders",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        help="worker processes for manifest jobs, or for rendering the files of"
+        " a single export (default: one per core)",
+    )
+    parser.add_argument("--book", help="only export lookups from this book")
+    parser.add_argument(
+        "--search",
+        metavar="QUERY",
+        help="only export lookups whose word or context matches this full-text"
+        ' query, e.g. \'"make up"\' or \'word: serendip*\'',
+    )
+    parser.add_argument(
+        "--date",
+        dest="dates",
+        action="append",
+        type=parse_date,
+        metavar="YYYY-MM-DD",
+        help="only export lookups from this day (repeatable)",
+    )
+    parser.add_argument(
+        "--from", dest="date_from", type=parse_date, metavar="YYYY-MM-DD"
+    )
+    parser.add_argument("--to", dest="date_to", type=parse_date, metavar="YYYY-MM-DD")
+    parser.add_argument("--per-book", action="store_true", help="one file per book")
+    parser.add_argument("--per-date", action="store_true", help="one file per day")
+    parser.add_argument(
+        "--folder-name", help="folder for date-based export (default: by_date)"
+    )
+    parser.add_argument(
+        "--no-tags",
+        dest="include_tags",
+        action="store_false",
+        help="do not write front matter metadata",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only append lookups added since the last export to this folder"
+        " (exports in full when a word was looked up again)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="print the files an export would write, without writing anything",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and export the new lookups whenever the database changes",
+    )
+    parser.add_argument(
+        "--in-memory",
+        dest="snapshot",
+        action="store_true",
+        help="copy the database into memory before querying it",
+    )
+    parser.add_argument(
+        "--timezone",
+        help="IANA timezone used to bucket lookups by day (default: system)",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="write a Chrome trace-event JSON of where the export spent its time",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="print a table of timings and counters to stderr when done",
+    )
+    parser.add_argument(
+        "--templates",
+        metavar="DIR",
+        help="folder with front_matter.md, book_header.md, entry.md and word_entry.md",
+    )
+    parser.add_argument(
+        "--format",
+        choices=("markdown", *RECORD_FORMATS),
+        default="markdown",
+        help="markdown notes, or one file with a record per lookup: NDJSON, CSV or"
+        " a TSV for Anki to import",
+    )
+    parser.add_argument(
+        "--aggregate",
+        action="store_true",
+        help="write one entry per word with all its contexts and its lookup count",
+    )
+    return parser
+
+
+def main(argv=None):
+    logging.basicConfig(
+        level=logging.ERROR, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.dry_run and args.watch:
+        parser.error("--dry-run cannot be combined with --watch")
+    # Jobs in worker processes record their own timings and hand them back
+    # with their summary.
+    tracing = bool(instrumentation.enable_from_environment())
+    if args.trace or args.timings:
+        instrumentation.enable()
+        tracing = True
+
+    defaults = {
+        "book": args.book,
+        "dates": [d.isoformat() for d in args.dates or ()],
+        "date_from": args.date_from and args.date_from.isoformat(),
+        "date_to": args.date_to and args.date_to.isoformat(),
+        "per_book": args.per_book,
+        "per_date": args.per_date,
+        "include_tags": args.include_tags,
+        "timezone": args.timezone,
+        "folder_name": args.folder_name,
+        "incremental": args.incremental,
+        "snapshot": args.snapshot,
+        "templates": args.templates,
+        "aggregate": args.aggregate,
+        "format": args.format,
+        "search": args.search,
+        "dry_run": args.dry_run,
+        "trace": tracing,
+    }
+
+    try:
+        if args.manifest:
+            if args.db or args.output:
+                parser.error("use either a database and --output or --manifest")
+            jobs = load_manifest(args.manifest, defaults)
+        else:
+            if not args.db or not args.output:
+                parser.error("a database and --output are required")
+            db = args.db[0] if len(args.db) == 1 else args.db
+            jobs = [dict(defaults, db=db, output=args.output)]
+        for job in jobs:
+            if not args.watch:
+                # Watching waits for a database that is not there yet,
+                # e.g. on an e-reader that is not plugged in.
+                check_databases(job["db"])
+            expand_dates(job.get("dates"), job.get("date_from"), job.get("date_to"))
+            resolve_timezone(job.get("timezone"))
+            load_templates(job.get("templates"))
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    failed = 0
+
+    def report(summary):
+        nonlocal failed
+        if "trace" in summary:
+            instrumentation.merge(summary["trace"])
+        print_summary(summary)
+        if summary["error"]:
+            failed += 1
+
+    if args.watch:
+        # Failed exports are reported as they happen and retried on the next
+        # change, so stopping the watch is not an error.
+        print("Watching for changes, press Ctrl+C to stop", file=sys.stderr)
+        watch_jobs(jobs, report, args.workers)
+        failed = 0
+    else:
+        for summary in run_jobs(jobs, args.workers):
+            report(summary)
+        if len(jobs) > 1:
+            print(f"{len(jobs) - failed}/{len(jobs)} jobs succeeded")
+
+    if args.trace:
+        instrumentation.write_trace(args.trace)
+    if args.timings:
+        print(instrumentation.summary(), file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,3 +19,15 @@ def load_theme():
 def save_theme(theme):
     with open(CONFIG_PATH, "w") as f:
         json.dump({"theme": theme}, f, indent=4)
+
+
+def cache_dir():
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+    path = os.path.join(base, "vocab-builder-to-md")
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,184 @@
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+MMAP_SIZE = 256 * 1024 * 1024
+SNAPSHOT_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS vocabulary_create_time ON vocabulary(create_time)",
+    "CREATE INDEX IF NOT EXISTS vocabulary_title_id ON vocabulary(title_id)",
+)
+
+_databases = {}
+_registry_lock = threading.Lock()
+_open_lock = threading.Lock()
+
+
+def database_paths(db_path):
+    # A single path, or a list of paths (one per reading device) whose
+    # lookups are merged when queried.
+    if isinstance(db_path, (list, tuple)):
+        return tuple(db_path)
+    return (db_path,)
+
+
+def database_key(db_path):
+    return tuple(os.path.abspath(path) for path in database_paths(db_path))
+
+
+def read_only_uri(path):
+    return "file:" + pathname2url(os.path.abspath(path)) + "?mode=ro"
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _file_identity(path):
+    # Open connections keep reading the file they opened, so a database
+    # replaced by a rename (as sync tools write it) or on a remounted device
+    # is a different file even at the same path.
+    stat = os.stat(path)
+    return stat.st_dev, stat.st_ino
+
+
+class VocabularyDatabase:
+    # Hands out read-only connections to one vocabulary database and reuses
+    # them between queries. With snapshot=True the file is copied once into a
+    # shared in-memory database (with extra indexes), so later queries never
+    # touch the e-reader's storage again; the user's file is never modified.
+    # Given several paths, the first is opened as "main" and the others are
+    # attached as source1, source2, ... on every connection; schemas lists
+    # them in order.
+
+    def __init__(self, path, snapshot=False):
+        self.path = path
+        self.paths = database_paths(path)
+        self.schemas = ["main"] + [f"source{i}" for i in range(1, len(self.paths))]
+        self.snapshot = snapshot
+        self.signature = [_file_signature(p) for p in self.paths]
+        self.identity = [_file_identity(p) for p in self.paths]
+        self._lock = threading.Lock()
+        self._idle = []
+        self._closed = False
+        self._anchors = []
+        if snapshot:
+            self._uris = [
+                f"file:vocab-snapshot-{uuid.uuid4().hex}?mode=memory&cache=shared"
+                for _ in self.paths
+            ]
+            for path, uri in zip(self.paths, self._uris):
+                self._take_snapshot(path, uri)
+        else:
+            self._uris = [read_only_uri(p) for p in self.paths]
+
+    def _take_snapshot(self, path, uri):
+        source = sqlite3.connect(read_only_uri(path), uri=True)
+        try:
+            anchor = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            source.backup(anchor)
+        finally:
+            source.close()
+        for statement in SNAPSHOT_INDEXES:
+            anchor.execute(statement)
+        anchor.commit()
+        anchor.execute("PRAGMA query_only = ON")
+        # The in-memory copy lives as long as at least one connection to it
+        # stays open, so the anchor is kept until close().
+        self._anchors.append(anchor)
+
+    def _open(self):
+        conn = sqlite3.connect(self._uris[0], uri=True, check_same_thread=False)
+        for schema, uri in zip(self.schemas[1:], self._uris[1:]):
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (uri,))
+        conn.execute("PRAGMA query_only = ON")
+        if not self.snapshot:
+            for schema in self.schemas:
+                conn.execute(f"PRAGMA {schema}.mmap_size = {MMAP_SIZE}")
+        return conn
+
+    def is_stale(self):
+        # A snapshot is stale once a file changes at all; connections to the
+        # files themselves see changes made in place, and only go stale when
+        # a file is replaced.
+        try:
+            if [_file_identity(p) for p in self.paths] != self.identity:
+                return True
+            if self.snapshot:
+                return [_file_signature(p) for p in self.paths] != self.signature
+        except OSError:
+            return True
+        return False
+
+    def acquire(self):
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("database has been closed")
+            if self._idle:
+                return self._idle.pop()
+        return self._open()
+
+    def release(self, conn):
+        with self._lock:
+            if not self._closed:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def connect(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+        for anchor in self._anchors:
+            anchor.close()
+        self._anchors = []
+
+
+def open_database(path, snapshot=False):
+    key = database_key(path)
+    database = VocabularyDatabase(path, snapshot=snapshot)
+    with _registry_lock:
+        previous = _databases.get(key)
+        _databases[key] = database
+    if previous is not None:
+        previous.close()
+    return database
+
+
+def get_database(path, snapshot=None):
+    # The pool for path, opened on first use and reopened once stale (in the
+    # same mode) or, given snapshot, when it was opened in the other mode. A
+    # pool in use is only replaced then, since replacing closes it. Pools
+    # are looked up and reopened under _open_lock, so threads finding the
+    # same stale pool replace it once and share the new one.
+    key = database_key(path)
+    with _open_lock:
+        with _registry_lock:
+            database = _databases.get(key)
+        if database is not None:
+            if snapshot is None or snapshot == database.snapshot:
+                if not database.is_stale():
+                    return database
+                snapshot = database.snapshot
+        return open_database(path, snapshot=bool(snapshot))
+
+
+def close_databases():
+    with _registry_lock:
+        databases = list(_databases.values())
+        _databases.clear()
+    for database in databases:
+        database.close()
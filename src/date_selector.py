@@ -0,0 +1,176 @@
+import calendar
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+import ttkbootstrap as ttk
+
+CHECKED = "☑"
+UNCHECKED = "☐"
+PARTIAL = "◩"
+
+
+class DateSelector(ttk.Frame):
+    # A year -> month -> day tree of lookup dates. Month and day rows are only
+    # created when their parent is expanded, and the selection is a plain set
+    # of ISO dates, so years of history cost a handful of widgets. Clicking a
+    # year or month toggles all of its days; shift-click selects the range of
+    # days since the previous click.
+
+    def __init__(self, parent, on_change=None, height=12):
+        super().__init__(parent)
+        self.on_change = on_change
+        self.dates = []
+        self.counts = {}
+        self.months_by_year = defaultdict(list)
+        self.days_by_month = defaultdict(list)
+        self.selected = set()
+        self.anchor = None
+
+        self.select_all_var = ttk.IntVar(value=0)
+        ttk.Checkbutton(
+            self,
+            text="Select All",
+            variable=self.select_all_var,
+            onvalue=1,
+            offvalue=0,
+            command=self.toggle_all,
+        ).pack(anchor="w")
+
+        tree_frame = ttk.Frame(self)
+        tree_frame.pack(fill="both", expand=True)
+        self.tree = ttk.Treeview(
+            tree_frame, show="tree", selectmode="none", height=height
+        )
+        scrollbar = ttk.Scrollbar(
+            tree_frame, orient="vertical", command=self.tree.yview
+        )
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+
+        self.tree.bind("<<TreeviewOpen>>", self.on_open)
+        self.tree.bind("<Button-1>", self.on_click)
+        self.tree.bind("<Shift-Button-1>", self.on_shift_click)
+
+    def set_dates(self, date_counts):
+        self.dates = sorted(date_counts)
+        self.counts = dict(date_counts)
+        self.selected &= set(self.dates)
+        self.anchor = None
+        self.months_by_year.clear()
+        self.days_by_month.clear()
+        for day in self.dates:
+            month = day[:7]
+            if not self.days_by_month[month]:
+                self.months_by_year[day[:4]].append(month)
+            self.days_by_month[month].append(day)
+
+        self.tree.delete(*self.tree.get_children())
+        for year in self.months_by_year:
+            self.tree.insert("", "end", iid=f"y{year}")
+            self.tree.insert(f"y{year}", "end", iid=f"p{year}")
+        self.refresh()
+
+    def clear(self):
+        self.selected.clear()
+        self.refresh()
+
+    def selected_dates(self):
+        # Nothing or everything selected means no date filter.
+        if len(self.selected) in (0, len(self.dates)):
+            return []
+        return sorted(self.selected)
+
+    def days_of(self, iid):
+        if iid.startswith("d"):
+            return [iid[1:]]
+        if iid.startswith("m"):
+            return self.days_by_month[iid[1:]]
+        return [d for m in self.months_by_year[iid[1:]] for d in self.days_by_month[m]]
+
+    def on_open(self, event):
+        iid = self.tree.focus()
+        placeholder = f"p{iid[1:]}"
+        if not self.tree.exists(placeholder):
+            return
+        self.tree.delete(placeholder)
+        if iid.startswith("y"):
+            for month in self.months_by_year[iid[1:]]:
+                self.tree.insert(iid, "end", iid=f"m{month}")
+                self.tree.insert(f"m{month}", "end", iid=f"p{month}")
+        else:
+            for day in self.days_by_month[iid[1:]]:
+                self.tree.insert(iid, "end", iid=f"d{day}")
+        self.refresh()
+
+    def clicked_item(self, event):
+        if "indicator" in self.tree.identify_element(event.x, event.y):
+            return None
+        iid = self.tree.identify_row(event.y)
+        return iid or None
+
+    def on_click(self, event):
+        iid = self.clicked_item(event)
+        if iid is None:
+            return
+        days = self.days_of(iid)
+        if all(d in self.selected for d in days):
+            self.selected.difference_update(days)
+        else:
+            self.selected.update(days)
+        if iid.startswith("d"):
+            self.anchor = iid[1:]
+        self.changed()
+        return "break"
+
+    def on_shift_click(self, event):
+        iid = self.clicked_item(event)
+        if iid is None or not iid.startswith("d") or self.anchor is None:
+            return self.on_click(event)
+        low, high = sorted((self.anchor, iid[1:]))
+        self.selected.update(
+            self.dates[bisect_left(self.dates, low) : bisect_right(self.dates, high)]
+        )
+        self.changed()
+        return "break"
+
+    def toggle_all(self):
+        if self.select_all_var.get() == 1:
+            self.selected.update(self.dates)
+        else:
+            self.selected.clear()
+        self.changed()
+
+    def changed(self):
+        self.refresh()
+        if self.on_change:
+            self.on_change()
+
+    def label(self, iid):
+        days = self.days_of(iid)
+        selected = sum(1 for d in days if d in self.selected)
+        if selected == 0:
+            mark = UNCHECKED
+        elif selected == len(days):
+            mark = CHECKED
+        else:
+            mark = PARTIAL
+        count = sum(self.counts[d] for d in days)
+        if iid.startswith("m"):
+            name = calendar.month_name[int(iid[6:8])]
+        else:
+            name = iid[1:]
+        return f"{mark} {name} ({count})"
+
+    def refresh(self):
+        # Only rows that exist, i.e. whose parent has been expanded at some
+        # point, are relabelled.
+        pending = list(self.tree.get_children())
+        while pending:
+            iid = pending.pop()
+            if iid.startswith("p"):
+                continue
+            self.tree.item(iid, text=self.label(iid))
+            pending.extend(self.tree.get_children(iid))
+        self.select_all_var.set(
+            1 if self.dates and len(self.selected) == len(self.dates) else 0
+        )
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+
+from src.database import database_key
+
+MANIFEST_NAME = ".vocab_builder_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def manifest_path(output_dir):
+    return os.path.join(output_dir, MANIFEST_NAME)
+
+
+def timezone_name(user_timezone):
+    if user_timezone is None:
+        return "local"
+    return getattr(user_timezone, "key", None) or str(user_timezone)
+
+
+def _database_setting(db_path):
+    # A single database keeps the plain path earlier manifests recorded.
+    paths = database_key(db_path)
+    return paths[0] if len(paths) == 1 else list(paths)
+
+
+def settings_fingerprint(
+    db_path,
+    book,
+    selected_dates,
+    per_book,
+    per_date,
+    include_tags,
+    custom_folder_name,
+    user_timezone,
+    templates=None,
+    aggregate=False,
+    search=None,
+):
+    settings = {
+        "version": MANIFEST_VERSION,
+        "db": _database_setting(db_path),
+        "book": book if book and book != "(All)" else None,
+        "dates": sorted(selected_dates),
+        "per_book": bool(per_book),
+        "per_date": bool(per_date),
+        "include_tags": bool(include_tags),
+        "folder": custom_folder_name,
+        "timezone": timezone_name(user_timezone),
+        "templates": templates,
+    }
+    if aggregate:
+        # Only recorded when set, so earlier manifests stay valid.
+        settings["aggregate"] = True
+    if search:
+        settings["search"] = search
+    encoded = json.dumps(settings, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()
+
+
+def load_manifest(output_dir):
+    try:
+        with open(manifest_path(output_dir), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def usable_files(manifest, output_dir, settings):
+    if manifest is None or manifest.get("settings") != settings:
+        return None
+    files = manifest.get("files", {})
+    for relpath in files:
+        if not os.path.exists(os.path.join(output_dir, relpath)):
+            return None
+    return files
+
+
+def _newest(marks):
+    # The latest of several (create_time, row_ids, last_rowid) marks, with
+    # the ids of every mark at that time and the highest rowid of any.
+    times = [time for time, _, _ in marks if time]
+    if not times:
+        return None
+    last = max(times)
+    ids = set()
+    for time, row_ids, _ in marks:
+        if time == last:
+            ids.update(row_ids)
+    rowids = [rowid for _, _, rowid in marks if rowid is not None]
+    return last, sorted(ids), max(rowids) if rowids else None
+
+
+def high_water_mark(files, sources=1):
+    # The newest lookups already in files, as {database position:
+    # (create_time, row_ids, last_rowid)}. Lookups later than create_time,
+    # or added with a higher rowid whatever their time (e.g. synced from
+    # another device), are new. Merged databases each get their own mark
+    # from the files' "source_marks", since their times and rowids are
+    # unrelated. Manifests from before last_rowid was kept have none.
+    marks = {}
+    for position in range(sources):
+        if sources == 1:
+            file_marks = [
+                (state["last_create_time"], state["last_ids"], state.get("last_rowid"))
+                for state in files.values()
+            ]
+        else:
+            file_marks = [
+                state["source_marks"].get(str(position), (None, [], None))
+                for state in files.values()
+            ]
+        mark = _newest(file_marks)
+        if mark:
+            marks[position] = mark
+    return marks
+
+
+def save_manifest(output_dir, settings, files, kept=None):
+    # files are the notes written with settings; kept are notes earlier
+    # exports with other settings wrote, which are only tracked so their
+    # digests stay known and are never appended to or deleted.
+    path = manifest_path(output_dir)
+    tmp_path = path + ".tmp"
+    manifest = {"version": MANIFEST_VERSION, "settings": settings, "files": files}
+    if kept:
+        manifest["kept"] = kept
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(
+            manifest,
+            f,
+            indent=1,
+            sort_keys=True,
+        )
+    os.replace(tmp_path, path)
+
+
+def discard_manifest(output_dir):
+    try:
+        os.remove(manifest_path(output_dir))
+    except FileNotFoundError:
+        pass
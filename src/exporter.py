@@ -1,163 +1,1351 @@
+import json
+import multiprocessing
 import os
-import sqlite3
-from datetime import datetime, timezone, timedelta
-from collections import defaultdict
-import re
-import tempfile
 import logging
+from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from src import instrumentation
+from src.export_manifest import (
+    discard_manifest,
+    high_water_mark,
+    load_manifest,
+    save_manifest,
+    settings_fingerprint,
+    usable_files,
+)
+from src.database import database_paths, get_database
+from src.filters import (
+    MAX_MERGED_DATABASES,
+    build_book_filter,
+    build_bound_filter,
+    build_date_filter,
+    build_day_buckets,
+    read_row_bound,
+    title_source,
+    vocabulary_source,
+)
+from src.instrumentation import count, span
+from src.layout import plan_layout, previous_slugs
+from src.output_files import OutputFile, remove_stale
+from src.search import search_filter, update_index
+from src.sinks import RECORD_FORMATS
+from src.templates import load_templates
+from src.timezones import EPOCH_ORDINAL
+from src.worker import Cancelled, cancellable
 
+WRITE_BUFFER_SIZE = 64 * 1024
+RENDER_CHUNK_PARTS = 512
+FETCH_ROWS = 1000
+# Exports smaller than this are rendered in-process; starting workers would
+# cost more than it saves.
+PARALLEL_MIN_FILES = 32
+PARALLEL_MIN_ROWS = 50_000
+PARTITIONS_PER_WORKER = 2
+CANCEL_POLL_SECONDS = 0.1
+# Stands for the local day number in partition filters (see _day_run_filter).
+DAY_PLACEHOLDER = "{day}"
 
-def sanitize_filename(name):
-    if not name:
-        return "unknown"
-    return re.sub(r"[^a-zA-Z0-9-_ ]", "", str(name)).replace(" ", "_")
+logger = logging.getLogger(__name__)
 
 
-def export_phrases(
+class ExportCancelled(Exception):
+    pass
+
+
+def new_export_stats():
+    return {
+        "rows": 0,
+        "total_rows": 0,
+        "files": 0,
+        "bytes": 0,
+        "written": 0,
+        "unchanged": 0,
+        "deleted": 0,
+    }
+
+
+def _selected_dates(dates):
+    return sorted(set(dates or ()))
+
+
+def _group_key(book_val, local_date, per_book, per_date):
+    key = ()
+    if per_book:
+        key += (book_val,)
+    if per_date:
+        key += (local_date,)
+    return key
+
+
+def _existing_content(filepath, state, include_tags, templates):
+    with open(filepath, "r", encoding="utf-8") as f:
+        text = f.read()
+    if include_tags:
+        text = templates.update_front_matter(text, state["books"], state["dates"])
+    return text
+
+
+def _new_file_state(book_names, date_values):
+    return {
+        "books": book_names,
+        "dates": date_values,
+        "last_book": None,
+        "last_create_time": None,
+        "last_ids": [],
+        "last_rowid": None,
+    }
+
+
+PHRASE_SQL = "COALESCE(REPLACE(a.prev_context || '==' || COALESCE(a.highlight, a.word) || '==' || a.next_context, CHAR(10), '<br>'), 'No context available')"
+ENTRY_COLUMNS = f"""
+    COALESCE(b.name, 'Unknown Book') AS book,
+    COALESCE(a.word, 'Unknown Word') AS word,
+    {PHRASE_SQL} AS phrase,
+"""
+# Aggregated entries carry all contexts of a word in one column, separated
+# by a control character that cannot occur in the text.
+PHRASE_SEPARATOR = "\x1f"
+AGGREGATE_COLUMNS = """
+    COALESCE(b.name, 'Unknown Book') AS book,
+    a.word,
+    a.phrases,
+"""
+
+
+def _entry_select(aggregate):
+    if aggregate:
+        return (
+            f"SELECT {AGGREGATE_COLUMNS} a.create_time, a.rowid,"
+            " a.lookups, a.last_time, a.times, a.ids"
+        )
+    return f"SELECT {ENTRY_COLUMNS} a.create_time, a.rowid"
+
+
+def _entry_rows(rows, aggregate):
+    # Aggregated rows keep their extra columns in the phrase slot, so both
+    # kinds of row unpack alike in the render loop. group_concat does not
+    # promise an order, so the contexts of a repeated word are put in time
+    # order here, using the times and ids concatenated alongside them.
+    if not aggregate:
+        return rows
+    entries = []
+    for row in rows:
+        book_val, word, phrases, create_time, row_id = row[:5]
+        lookups, last_time, times, ids = row[5:]
+        if lookups == 1:
+            phrases = [phrases]
+        else:
+            phrases = [
+                phrase
+                for _, _, phrase in sorted(
+                    zip(
+                        map(int, times.split(",")),
+                        map(int, ids.split(",")),
+                        phrases.split(PHRASE_SEPARATOR),
+                    )
+                )
+            ]
+        entries.append(
+            (book_val, word, (phrases, lookups, last_time), create_time, row_id)
+        )
+    return entries
+
+
+def _advance_source_mark(marks, create_time, row_id):
+    # Moves the [create_time, row_ids, last_rowid] mark of the database a
+    # merged lookup came from (its position is encoded in row_id) past it.
+    source = str(row_id % MAX_MERGED_DATABASES)
+    mark = marks.get(source)
+    if mark is None:
+        marks[source] = [create_time, [row_id], row_id]
+        return
+    if create_time > mark[0]:
+        mark[0] = create_time
+        mark[1] = [row_id]
+    elif create_time == mark[0]:
+        mark[1].append(row_id)
+    mark[2] = max(mark[2], row_id)
+
+
+def _entry_renderer(templates, buckets, aggregate):
+    # A function rendering one row as (book, word, phrase, day), with the
+    # phrase slot as filled in by _entry_rows.
+    if not aggregate:
+        return templates.entry
+    word_entry = templates.word_entry
+    day = buckets.day
+
+    def entry(book_val, word, details, first_day):
+        phrases, lookups, last_time = details
+        return word_entry(book_val, word, phrases, lookups, first_day, day(last_time))
+
+    return entry
+
+
+def _aggregated_lookups(schemas, where, buckets, per_date, contexts=True):
+    # One row per word and book (and day, when exporting per date), with
+    # the first lookup's create_time and lowest rowid, so it sorts and pages
+    # like a single lookup. Words that differ only in case are one word,
+    # shown in lower case where a lookup used it.
+    day = f", {buckets.sql()}" if per_date else ""
+    word = "COALESCE(b.name, 'Unknown Book'), LOWER(a.word)"
+    if not contexts and not per_date:
+        # Planning needs no contexts, but the front matter lists every day a
+        # word was looked up, not just its first; those days come in as
+        # extra rows without a rowid, so counting rowids counts entries.
+        return f"""
+        WITH matching AS NOT MATERIALIZED (
+            SELECT a.title_id, a.create_time, a.rowid, a.word,
+                COALESCE(b.name, 'Unknown Book') AS book
+            FROM {vocabulary_source(schemas)}
+            WHERE {where}
+        )
+        SELECT title_id, MIN(create_time) AS create_time, MIN(rowid) AS rowid
+        FROM matching
+        GROUP BY book, LOWER(word)
+        UNION ALL
+        SELECT title_id, MIN(create_time), NULL
+        FROM matching
+        GROUP BY title_id, {buckets.sql("create_time")}
+    """
+    columns = "a.title_id, MIN(a.create_time) AS create_time, MIN(a.rowid) AS rowid"
+    if contexts:
+        columns += f""",
+            MAX(COALESCE(a.word, 'Unknown Word')) AS word,
+            GROUP_CONCAT({PHRASE_SQL}, CHAR(31)) AS phrases,
+            GROUP_CONCAT(a.create_time) AS times,
+            GROUP_CONCAT(a.rowid) AS ids,
+            COUNT(*) AS lookups,
+            MAX(a.create_time) AS last_time"""
+    return f"""
+        SELECT {columns}
+        FROM {vocabulary_source(schemas)}
+        WHERE {where}
+        GROUP BY {word}{day}
+    """
+
+
+def _order_by(per_book, per_date, buckets):
+    # Local days only ever move forward with create_time, so within a book
+    # ordering by create_time already orders by day; the day expression is
+    # only needed to put days first.
+    if per_date and not per_book:
+        order_by = f"{buckets.sql()}, book"
+    else:
+        order_by = "book"
+    return f" ORDER BY {order_by}, a.create_time, a.rowid"
+
+
+def _phrase_source(
+    cursor,
+    database,
+    selected_dates,
+    book,
+    user_timezone,
+    after=None,
+    partition=None,
+    aggregate=False,
+    per_date=False,
+    search=None,
+    bound=None,
+):
+    schemas = database.schemas
+    buckets = build_day_buckets(cursor, user_timezone, schemas)
+
+    filters = ["a.create_time IS NOT NULL"]
+    params = []
+    partition_condition, partition_params = partition or (None, [])
+    if partition_condition:
+        partition_condition = partition_condition.replace(
+            DAY_PLACEHOLDER, buckets.sql()
+        )
+    search_condition = (None, [])
+    if search:
+        search_condition = search_filter(cursor.connection, database.path, search)
+    for condition, condition_params in (
+        build_date_filter(_selected_dates(selected_dates), user_timezone),
+        build_book_filter(book),
+        (partition_condition, partition_params),
+        search_condition,
+        build_bound_filter(bound),
+    ):
+        if condition:
+            filters.append(condition)
+            params.extend(condition_params)
+
+    for position, (last_time, last_ids, last_rowid) in sorted((after or {}).items()):
+        # Merged lookups carry their database's position in their ids (see
+        # vocabulary_source), and each database has its own mark.
+        newer = []
+        if len(schemas) > 1:
+            newer.append(f"a.rowid % {MAX_MERGED_DATABASES} <> {position}")
+        if last_rowid is not None:
+            newer.append("a.rowid > ?")
+            params.append(last_rowid)
+        placeholders = ", ".join("?" * len(last_ids))
+        newer.append(
+            "a.create_time > ? OR (a.create_time = ?"
+            f" AND a.rowid NOT IN ({placeholders}))"
+        )
+        params.extend([last_time, last_time, *last_ids])
+        filters.append(f"({' OR '.join(newer)})")
+
+    # Returns the buckets, the FROM/WHERE clause for entries, a cheaper one
+    # for planning (see _plan_groups), and their parameters.
+    where = " AND ".join(filters)
+    if not aggregate:
+        source = f"""
+        FROM {vocabulary_source(schemas)}
+        WHERE {where}"""
+        return buckets, source, source, params
+    sources = [
+        f"""
+        FROM ({_aggregated_lookups(schemas, where, buckets, per_date, contexts)}) AS a
+        LEFT JOIN {title_source(schemas)} AS b ON a.title_id = b.id
+        WHERE a.create_time IS NOT NULL"""
+        for contexts in (True, False)
+    ]
+    return buckets, sources[0], sources[1], params
+
+
+def _plan_groups(
+    cursor,
+    buckets,
+    source,
+    params,
+    per_book,
+    per_date,
+    custom_folder_name,
+    previous_layout=None,
+):
+    # Front matter needs every book and date of a group before its first
+    # entry is written, so collect them up front from the (small) set of
+    # book/day pairs instead of holding the rows themselves. A per-book or
+    # per-date export can plan tens of thousands of groups, so book names are
+    # interned (the cursor returns a new string per row), only the books or
+    # dates not fixed by the group key are collected in sets, and groups with
+    # the same books or dates share one tuple of them. Rows of the source
+    # without a rowid only add their day (see _aggregated_lookups).
+    cursor.execute(
+        f"""
+        SELECT
+            COALESCE(b.name, 'Unknown Book') AS book,
+            {buckets.sql()} AS day,
+            COUNT(a.rowid)
+        """
+        + source
+        + " GROUP BY book, day",
+        params,
+    )
+    groups = {}
+    names = {}
+    for book_val, day_number, rows in cursor:
+        book_val = names.setdefault(book_val, book_val)
+        local_date = buckets.name(day_number)
+        key = _group_key(book_val, local_date, per_book, per_date)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {
+                "key": key,
+                "books": (book_val,) if per_book else set(),
+                "dates": (local_date,) if per_date else set(),
+                "count": 0,
+            }
+        if not per_book:
+            group["books"].add(book_val)
+        if not per_date:
+            group["dates"].add(local_date)
+        group["count"] += rows
+
+    shared = {}
+    planned = []
+    for key in sorted(groups):
+        group = groups[key]
+        for field in ("books", "dates"):
+            values = tuple(sorted(group[field]))
+            group[field] = shared.setdefault(values, values)
+        planned.append(group)
+    return plan_layout(
+        planned, per_book, per_date, custom_folder_name, previous_layout
+    )
+
+
+def read_bound(db_path):
+    # The newest lookups of db_path right now (see read_row_bound).
+    database = get_database(db_path)
+    with database.connect() as conn:
+        return read_row_bound(conn.cursor(), database.schemas)
+
+
+def plan_export(
     db_path,
-    output_dir,
-    date_vars,
+    selected_dates,
+    book,
+    per_book=False,
+    per_date=False,
+    custom_folder_name=None,
+    user_timezone=None,
+    after=None,
+    aggregate=False,
+    search=None,
+    previous_layout=None,
+    bound=None,
+):
+    # The files an export will produce, in output order, each with its key,
+    # relative path, books, dates and entry count. previous_layout maps books
+    # to the folders an earlier export per book gave them (see src.layout).
+    # bound, from read_bound, limits the plan to the lookups that existed
+    # then; render the plan with the same bound, or lookups added in between
+    # land in files it does not have.
+    database = get_database(db_path)
+    with database.connect() as conn:
+        cursor = conn.cursor()
+        buckets, _, plan_source, params = _phrase_source(
+            cursor,
+            database,
+            selected_dates,
+            book,
+            user_timezone,
+            after,
+            aggregate=aggregate,
+            per_date=per_date,
+            search=search,
+            bound=bound,
+        )
+        return _plan_groups(
+            cursor,
+            buckets,
+            plan_source,
+            params,
+            per_book,
+            per_date,
+            custom_folder_name,
+            previous_layout,
+        )
+
+
+def render_phrases(
+    db_path,
+    selected_dates,
     book,
-    filters_shown,
     per_book=False,
     per_date=False,
-    is_preview=False,
     custom_folder_name=None,
     user_timezone=None,
     include_tags=True,
+    files_state=None,
+    after=None,
+    stats=None,
+    templates=None,
+    groups=None,
+    partition=None,
+    aggregate=False,
+    search=None,
+    bound=None,
 ):
-    logging.basicConfig(
-        level=logging.ERROR, format="%(asctime)s - %(levelname)s - %(message)s"
-    )
-    target_dir = (
-        os.path.join(tempfile.gettempdir(), "vocab_builder_cache")
-        if is_preview
-        else output_dir
-    )
-    os.makedirs(target_dir, exist_ok=True)
+    # Yields (relative_path, markdown_chunk) pairs, grouped by file and in
+    # output order. files_state maps relative paths to the state recorded in the
+    # export manifest; it is updated in place, and files already listed in it
+    # only receive their new entries (no front matter). after is an optional
+    # high-water mark, {database position: (create_time, row_ids)} (see
+    # high_water_mark): only later rows are rendered. stats, if given, receives
+    # the total and rendered row counts. groups is the plan from plan_export, if
+    # already made. partition is an extra (condition, params) filter; groups
+    # must then hold just the groups it selects. With aggregate, each word gets
+    # one entry per book (and day, per date) holding all its lookups, rendered
+    # with the word_entry template; after does not apply then. search is a
+    # full-text query over the lookups (see src.search), whose index must be up
+    # to date. bound must be the one groups was planned with (see
+    # plan_export); without groups, the plan made here gets a bound of its own.
+    if files_state is None:
+        files_state = {}
+    if stats is None:
+        stats = new_export_stats()
+    if templates is None:
+        templates = load_templates()
 
+    with span("connect"):
+        database = get_database(db_path)
+        conn = database.acquire()
     try:
-        conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
+        if groups is None and bound is None:
+            bound = read_row_bound(cursor, database.schemas)
+        with span("bucket.setup"):
+            buckets, source, plan_source, params = _phrase_source(
+                cursor,
+                database,
+                selected_dates,
+                book,
+                user_timezone,
+                after,
+                partition,
+                aggregate,
+                per_date,
+                search,
+                bound,
+            )
+        entry = _entry_renderer(templates, buckets, aggregate)
+        merged = len(database.schemas) > 1
+        if groups is None:
+            with span("group"):
+                groups = _plan_groups(
+                    cursor,
+                    buckets,
+                    plan_source,
+                    params,
+                    per_book,
+                    per_date,
+                    custom_folder_name,
+                )
+        groups = {group["key"]: group for group in groups}
+        stats["total_rows"] = sum(group["count"] for group in groups.values())
 
-        selected_dates = [d for d, var in date_vars.items() if var.get() == 1]
-        filters = []
-        params = []
+        with span("query"):
+            cursor.execute(
+                _entry_select(aggregate)
+                + source
+                + _order_by(per_book, per_date, buckets),
+                params,
+            )
 
-        if selected_dates:
-            if len(selected_dates) == len(date_vars):
-                selected_dates = []
-            else:
-                date_conditions = []
-                for date in selected_dates:
-                    start = datetime.strptime(date, "%Y-%m-%d").replace(
-                        tzinfo=user_timezone
+        # Rows are fetched, bucketed into days and rendered a batch at a time.
+        # The inner loop runs once per lookup, so the group key is only worked
+        # out when the book or day changes, and the row count and high-water
+        # mark live in locals until the file or chunk is done (merged
+        # databases also get a mark each, in the file's "source_marks").
+        # Finished chunks wait in ready until the batch is rendered, so that
+        # the timing spans never include the consumer's time.
+        relpath = None
+        state = None
+        parts = []
+        append = parts.append
+        ready = []
+        rendered = 0
+        current_key = None
+        current_book = None
+        previous_book = previous_day = None
+        last_time = None
+        last_ids = []
+        last_rowid = None
+        while True:
+            with span("fetch"):
+                rows = _entry_rows(cursor.fetchmany(FETCH_ROWS), aggregate)
+            if not rows:
+                break
+            with span("bucket"):
+                days = buckets.days([row[3] for row in rows])
+            with span("render"):
+                for row, local_date in zip(rows, days):
+                    book_val, word, phrase, create_time, row_id = row
+                    if book_val != previous_book or local_date != previous_day:
+                        previous_book = book_val
+                        previous_day = local_date
+                        key = _group_key(book_val, local_date, per_book, per_date)
+                        if state is None or key != current_key:
+                            if parts:
+                                ready.append((relpath, "".join(parts), rendered))
+                                rendered = 0
+                                parts.clear()
+                            if state is not None:
+                                state["last_create_time"] = last_time
+                                state["last_ids"] = last_ids
+                                state["last_rowid"] = last_rowid
+                            group = groups[key]
+                            relpath = group["path"]
+                            state = files_state.get(relpath)
+                            if state is None:
+                                if include_tags:
+                                    append(
+                                        templates.front_matter(
+                                            group["books"], group["dates"]
+                                        )
+                                    )
+                                state = _new_file_state(group["books"], group["dates"])
+                                files_state[relpath] = state
+                            else:
+                                state["books"] = sorted(
+                                    set(state["books"]) | set(group["books"])
+                                )
+                                state["dates"] = sorted(
+                                    set(state["dates"]) | set(group["dates"])
+                                )
+                            current_key = key
+                            current_book = state["last_book"]
+                            last_time = state["last_create_time"]
+                            last_ids = state["last_ids"]
+                            last_rowid = state.get("last_rowid")
+                            if merged:
+                                marks = state.setdefault("source_marks", {})
+
+                    if not per_book and book_val != current_book:
+                        append(templates.book_header(book_val))
+                        current_book = book_val
+                        state["last_book"] = book_val
+                    append(entry(book_val, word, phrase, local_date))
+                    rendered += 1
+                    if rendered >= RENDER_CHUNK_PARTS:
+                        ready.append((relpath, "".join(parts), rendered))
+                        rendered = 0
+                        parts.clear()
+
+                    if last_time is None or create_time > last_time:
+                        last_time = create_time
+                        last_ids = [row_id]
+                    elif create_time == last_time:
+                        last_ids.append(row_id)
+                    if last_rowid is None or row_id > last_rowid:
+                        last_rowid = row_id
+                    if merged:
+                        _advance_source_mark(marks, create_time, row_id)
+
+            for chunk_path, chunk, chunk_rows in ready:
+                stats["rows"] += chunk_rows
+                yield chunk_path, chunk
+            ready.clear()
+
+        if state is not None:
+            state["last_create_time"] = last_time
+            state["last_ids"] = last_ids
+            state["last_rowid"] = last_rowid
+        if parts:
+            stats["rows"] += rendered
+            yield relpath, "".join(parts)
+    finally:
+        database.release(conn)
+
+
+class PreviewPages:
+    # Random access to the rendered output for the preview window: the list
+    # of files with their entry counts is computed up front, and pages of
+    # entries are rendered on demand with LIMIT/OFFSET so that only what is
+    # on screen is ever held in memory. Planning reads the whole database,
+    # so it is meant to run on a QueryWorker; cancelled() stops it (with
+    # Cancelled, or sqlite3.OperationalError from a running query).
+
+    def __init__(
+        self,
+        db_path,
+        selected_dates,
+        book,
+        per_book=False,
+        per_date=False,
+        user_timezone=None,
+        include_tags=True,
+        templates=None,
+        aggregate=False,
+        search=None,
+        cancelled=None,
+    ):
+        self.db_path = db_path
+        self.aggregate = aggregate
+        self.search = search
+        self.per_book = per_book
+        self.per_date = per_date
+        self.user_timezone = user_timezone
+        self.include_tags = include_tags
+        self.templates = templates or load_templates()
+        if search:
+            update_index(db_path, cancelled)
+        database = get_database(db_path)
+        with span("preview.plan"), database.connect() as conn:
+            cancellable(conn, cancelled)
+            try:
+                cursor = conn.cursor()
+                # Pages are queried later, so they are kept to the lookups
+                # the plan counted.
+                bound = read_row_bound(cursor, database.schemas)
+                self.buckets, self.source, plan_source, self.params = (
+                    _phrase_source(
+                        cursor,
+                        database,
+                        selected_dates,
+                        book,
+                        user_timezone,
+                        aggregate=aggregate,
+                        per_date=per_date,
+                        search=search,
+                        bound=bound,
                     )
-                    end = (start + timedelta(days=1)).replace(tzinfo=user_timezone)
-                    date_conditions.append("(a.create_time >= ? AND a.create_time < ?)")
-                    params.extend([int(start.timestamp()), int(end.timestamp())])
-                filters.append("(" + " OR ".join(date_conditions) + ")")
-
-        if book and book != "(All)":
-            filters.append("b.name = ?")
-            params.append(book)
-
-        query = """
-            SELECT
-                b.name AS book,
-                a.word,
-                REPLACE(a.prev_context || '==' || COALESCE(a.highlight, a.word) || '==' || a.next_context, CHAR(10), '<br>') AS phrase,
-                a.create_time AS timestamp
-            FROM vocabulary AS a
-            LEFT JOIN title AS b ON a.title_id = b.id
-        """
-        if filters:
-            query += " WHERE " + " AND ".join(filters)
+                )
+                self.groups = _plan_groups(
+                    cursor,
+                    self.buckets,
+                    plan_source,
+                    self.params,
+                    per_book,
+                    per_date,
+                    None,
+                )
+            finally:
+                cancellable(conn, None)
+        self.total_entries = sum(group["count"] for group in self.groups)
+
+    def render(self, index, start, limit):
+        group = self.groups[index]
+        filters = []
+        params = list(self.params)
+        if self.per_book:
+            filters.append("COALESCE(b.name, 'Unknown Book') = ?")
+            params.append(group["key"][0])
+        if self.per_date:
+            # By day number, as the plan counted the group's lookups.
+            condition, day_params = _day_run_filter([group])
+            filters.append(condition.replace(DAY_PLACEHOLDER, self.buckets.sql()))
+            params.extend(day_params)
 
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
+        # The entry before the page tells whether the page starts a new book.
+        offset = max(start - 1, 0)
+        params.extend([limit + start - offset, offset])
+        query = (
+            _entry_select(self.aggregate)
+            + self.source
+            + "".join(" AND " + f for f in filters)
+            + _order_by(self.per_book, self.per_date, self.buckets)
+            + " LIMIT ? OFFSET ?"
+        )
+        with span("preview.page"), get_database(self.db_path).connect() as conn:
+            if self.search:
+                # The index is attached per connection, and this one from the
+                # pool may not be the one the plan ran on.
+                search_filter(conn, self.db_path, self.search)
+            rows = _entry_rows(conn.execute(query, params).fetchall(), self.aggregate)
 
-        grouped = defaultdict(list)
+        templates = self.templates
+        parts = []
+        current_book = None
+        if start > 0 and rows:
+            current_book = rows[0][0]
+            rows = rows[1:]
+        elif self.include_tags:
+            parts.append(templates.front_matter(group["books"], group["dates"]))
+        days = self.buckets.days([row[3] for row in rows])
+        entry = _entry_renderer(templates, self.buckets, self.aggregate)
+        for (book_val, word, phrase, _, _), local_date in zip(rows, days):
+            if not self.per_book and book_val != current_book:
+                parts.append(templates.book_header(book_val))
+                current_book = book_val
+            parts.append(entry(book_val, word, phrase, local_date))
+        return "".join(parts)
 
-        for book_val, word, phrase, timestamp in rows:
-            if timestamp is None:
+
+def write_files(
+    chunks,
+    target_dir,
+    files_state=None,
+    include_tags=True,
+    stats=None,
+    progress=None,
+    cancelled=None,
+    templates=None,
+    previous_records=None,
+):
+    # Writes rendered chunks to target_dir, whose folders must already
+    # exist (see make_folders). Files already in files_state when
+    # writing starts exist from a previous export and get the new entries
+    # appended, after their front matter has been brought up to date. Every
+    # file is written through an OutputFile, so it is replaced atomically and
+    # left alone when its content did not change; previous_records holds the
+    # digests from the last manifest, and the new ones are stored in
+    # files_state. progress(stats) is called after every chunk; cancelled()
+    # is checked before each new file.
+    if files_state is None:
+        files_state = {}
+    if previous_records is None:
+        previous_records = {}
+    if stats is None:
+        stats = new_export_stats()
+    if templates is None:
+        templates = load_templates()
+    appending = set(files_state)
+    written_files = []
+    current = None
+    out = None
+
+    def finish_file():
+        with span("write.close"):
+            result = out.commit(previous_records.get(current))
+        stats[result] += 1
+        stats["files"] += 1
+        stats["bytes"] += out.record["size"]
+        files_state.setdefault(current, {}).update(out.record)
+
+    try:
+        for relpath, chunk in chunks:
+            if relpath != current:
+                if out is not None:
+                    finish_file()
+                    out = None
+                if cancelled is not None and cancelled():
+                    raise ExportCancelled()
+                filepath = os.path.join(target_dir, relpath)
+                with span("write.open"):
+                    out = OutputFile(filepath, buffering=WRITE_BUFFER_SIZE)
+                    if relpath in appending:
+                        out.write(
+                            _existing_content(
+                                filepath, files_state[relpath], include_tags, templates
+                            )
+                        )
+                written_files.append(filepath)
+                current = relpath
+            with span("write"):
+                out.write(chunk)
+            count("chunks")
+            if progress is not None:
+                progress(stats)
+        if out is not None:
+            finish_file()
+            out = None
+            if progress is not None:
+                progress(stats)
+    finally:
+        if out is not None:
+            out.discard()
+    return written_files
+
+
+def make_folders(target_dir, groups):
+    # One makedirs per distinct folder, before any file is written.
+    with span("write.folders"):
+        for folder in sorted({os.path.dirname(group["path"]) for group in groups}):
+            os.makedirs(os.path.join(target_dir, folder), exist_ok=True)
+
+
+def _day_number(day):
+    return datetime.strptime(day, "%Y-%m-%d").date().toordinal() - EPOCH_ORDINAL
+
+
+def _day_run_filter(run):
+    # By day number rather than by time: where a transition repeats
+    # midnight, a day's lookups are not one time range.
+    return f"{DAY_PLACEHOLDER} BETWEEN ? AND ?", [
+        _day_number(run[0]["dates"][0]),
+        _day_number(run[-1]["dates"][0]),
+    ]
+
+
+def _partition_groups(groups, parts, per_date):
+    # Splits the plan into up to parts partitions of about equal row counts
+    # that can be rendered independently, each with the filter that selects
+    # its rows. Files per date (and book) are cut into runs of consecutive
+    # days, so a partition's query is a single range of days; files per
+    # book are dealt out whole, the biggest first, each onto the lightest
+    # partition so far.
+    if per_date:
+        total = sum(group["count"] for group in groups)
+        runs = [[]]
+        done = 0
+        for group in sorted(groups, key=lambda group: (group["dates"], group["key"])):
+            if runs[-1] and done >= total * len(runs) / parts:
+                if runs[-1][-1]["dates"] != group["dates"]:
+                    runs.append([])
+            runs[-1].append(group)
+            done += group["count"]
+        return [(run, _day_run_filter(run)) for run in runs]
+
+    partitions = [[] for _ in range(min(parts, len(groups)))]
+    loads = [0] * len(partitions)
+    for group in sorted(groups, key=lambda group: (-group["count"], group["key"])):
+        lightest = loads.index(min(loads))
+        partitions[lightest].append(group)
+        loads[lightest] += group["count"]
+    return [
+        (
+            partition,
+            (
+                "COALESCE(b.name, 'Unknown Book') IN"
+                " (SELECT value FROM json_each(?))",
+                [json.dumps([group["key"][0] for group in partition])],
+            ),
+        )
+        for partition in partitions
+    ]
+
+
+_worker_cancel_event = None
+
+
+def _init_export_worker(cancel_event, tracing):
+    # Each worker opens its own connections and records its own timings,
+    # which go back to the parent with every result.
+    global _worker_cancel_event
+    _worker_cancel_event = cancel_event
+    instrumentation.disable()
+    if tracing:
+        instrumentation.enable()
+
+
+def _export_partition(task):
+    files_state = task.pop("files_state")
+    previous_records = task.pop("previous_records")
+    output_dir = task.pop("output_dir")
+    include_tags = task["include_tags"]
+    templates = load_templates(task.pop("template_dir"))
+    stats = new_export_stats()
+    chunks = render_phrases(
+        files_state=files_state, stats=stats, templates=templates, **task
+    )
+    written_files = write_files(
+        chunks,
+        output_dir,
+        files_state,
+        include_tags=include_tags,
+        stats=stats,
+        cancelled=_worker_cancel_event.is_set,
+        templates=templates,
+        previous_records=previous_records,
+    )
+    return {
+        "files": written_files,
+        "files_state": files_state,
+        "stats": stats,
+        "trace": instrumentation.collect(),
+    }
+
+
+def _write_parallel(
+    task,
+    groups,
+    workers,
+    output_dir,
+    files_state,
+    previous_records,
+    stats,
+    progress,
+    cancelled,
+):
+    # Renders and writes the partitions in worker processes. Every file
+    # belongs to exactly one partition and is produced by the same code as
+    # in-process, so the output does not depend on the number of workers.
+    # Progress is reported per finished partition.
+    partitions = _partition_groups(
+        groups,
+        workers * PARTITIONS_PER_WORKER,
+        task["per_date"],
+    )
+    # Spawned, not forked: a forked worker would inherit the pooled SQLite
+    # connections of src.database (which SQLite forbids using across a
+    # fork) and, from the GUI, locks held by its other threads. Spawning is
+    # also what Windows always does, so every platform behaves alike.
+    context = multiprocessing.get_context("spawn")
+    cancel_event = context.Event()
+    written_files = []
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(partitions)),
+        mp_context=context,
+        initializer=_init_export_worker,
+        initargs=(cancel_event, instrumentation.enabled()),
+    ) as pool:
+        pending = set()
+        for partition, partition_filter in partitions:
+            paths = [group["path"] for group in partition]
+            pending.add(
+                pool.submit(
+                    _export_partition,
+                    dict(
+                        task,
+                        groups=partition,
+                        partition=partition_filter,
+                        output_dir=output_dir,
+                        files_state={
+                            path: files_state[path]
+                            for path in paths
+                            if path in files_state
+                        },
+                        previous_records={
+                            path: previous_records[path]
+                            for path in paths
+                            if path in previous_records
+                        },
+                    ),
+                )
+            )
+        try:
+            while pending:
+                done, pending = wait(
+                    pending, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED
+                )
+                if cancelled is not None and cancelled():
+                    raise ExportCancelled()
+                for future in done:
+                    result = future.result()
+                    instrumentation.merge(result["trace"])
+                    written_files.extend(result["files"])
+                    files_state.update(result["files_state"])
+                    for name in ("rows", "files", "bytes", "written", "unchanged"):
+                        stats[name] += result["stats"][name]
+                    if progress is not None:
+                        progress(stats)
+        except BaseException:
+            cancel_event.set()
+            pool.shutdown(cancel_futures=True)
+            raise
+    return written_files
+
+
+def _updated_in_place(db_path, selected_dates, book, user_timezone, search, after):
+    # Whether a lookup the high-water mark after covers has moved past it
+    # since: KOReader keeps the row of a word looked up again and gives it
+    # a later create_time and the new context. Only lookups the filters
+    # select are checked, like those exported.
+    database = get_database(db_path)
+    merged = len(database.schemas) > 1
+    with database.connect() as conn:
+        cursor = conn.cursor()
+        _, source, _, params = _phrase_source(
+            cursor, database, selected_dates, book, user_timezone, search=search
+        )
+        updated = []
+        for position, (last_time, last_ids, last_rowid) in sorted(after.items()):
+            if last_rowid is None:
+                # Manifests from before last_rowid was kept cannot tell.
                 continue
-            book_val = book_val or "Unknown Book"
-            word = word or "Unknown Word"
-            phrase = phrase or "No context available"
-            local_date = (
-                datetime.fromtimestamp(int(timestamp), tz=timezone.utc)
-                .astimezone(user_timezone)
-                .date()
-                .isoformat()
+            condition = (
+                "a.rowid <= ? AND (a.create_time > ? OR (a.create_time = ?"
+                f" AND a.rowid NOT IN ({', '.join('?' * len(last_ids))})))"
+            )
+            if merged:
+                condition += f" AND a.rowid % {MAX_MERGED_DATABASES} = {position}"
+            updated.append(f"({condition})")
+            params.extend([last_rowid, last_time, last_time, *last_ids])
+        if not updated:
+            return False
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1{source} AND ({' OR '.join(updated)}))", params
+        )
+        return bool(cursor.fetchone()[0])
+
+
+def _update_search_index(db_path, cancelled):
+    try:
+        update_index(db_path, cancelled)
+    except Cancelled:
+        raise ExportCancelled()
+
+
+RECORD_COLUMNS = """
+    COALESCE(b.name, 'Unknown Book') AS book,
+    a.word,
+    a.highlight,
+    a.prev_context,
+    a.next_context,
+    a.create_time
+"""
+
+
+def export_records(
+    db_path,
+    output_dir,
+    selected_dates,
+    book,
+    output_format,
+    user_timezone=None,
+    progress=None,
+    cancelled=None,
+    stats=None,
+    search=None,
+    dry_run=False,
+):
+    # Writes every selected lookup as one record in output_format (see
+    # src.sinks) to a single file, streamed from the cursor FETCH_ROWS at a
+    # time so memory stays flat. There are no notes to group or append to,
+    # so the export manifest and the notes it lists are left alone.
+    sink = RECORD_FORMATS.get(output_format)
+    if sink is None:
+        return None, f"unknown output format '{output_format}'"
+    if stats is None:
+        stats = {}
+    stats.update(new_export_stats())
+    out = None
+    try:
+        with span("export", output_format=output_format):
+            path = os.path.join(output_dir, "vocabulary_builder" + sink["extension"])
+            if search:
+                _update_search_index(db_path, cancelled)
+            with span("connect"):
+                database = get_database(db_path)
+                conn = database.acquire()
+            try:
+                cursor = conn.cursor()
+                with span("bucket.setup"):
+                    buckets, source, _, params = _phrase_source(
+                        cursor,
+                        database,
+                        selected_dates,
+                        book,
+                        user_timezone,
+                        search=search,
+                    )
+                with span("group"):
+                    cursor.execute("SELECT COUNT(*)" + source, params)
+                    stats["total_rows"] = cursor.fetchone()[0]
+                if dry_run:
+                    stats["files"] = 1
+                    return [path], None
+                with span("query"):
+                    cursor.execute(
+                        f"SELECT {RECORD_COLUMNS}"
+                        + source
+                        + " ORDER BY a.create_time, a.rowid",
+                        params,
+                    )
+
+                os.makedirs(output_dir, exist_ok=True)
+                out = OutputFile(path, buffering=WRITE_BUFFER_SIZE)
+                out.write(sink["header"])
+                render = sink["render"]
+                while True:
+                    if cancelled is not None and cancelled():
+                        raise ExportCancelled()
+                    with span("fetch"):
+                        rows = cursor.fetchmany(FETCH_ROWS)
+                    if not rows:
+                        break
+                    with span("bucket"):
+                        days = buckets.days([row[5] for row in rows])
+                    with span("render"):
+                        text = render(rows, days)
+                    with span("write"):
+                        out.write(text)
+                    stats["rows"] += len(rows)
+                    count("chunks")
+                    if progress is not None:
+                        progress(stats)
+            finally:
+                database.release(conn)
+
+            with span("write.close"):
+                stats[out.commit()] += 1
+            stats["files"] = 1
+            stats["bytes"] = out.record["size"]
+            out = None
+            if progress is not None:
+                progress(stats)
+            for name in ("rows", "files", "bytes", "written", "unchanged"):
+                count(name, stats[name])
+            return [path], None
+
+    except ExportCancelled:
+        return None, "Export cancelled"
+
+    except Exception as e:
+        logger.error("Error in export_records", exc_info=True)
+        return None, str(e)
+
+    finally:
+        if out is not None:
+            out.discard()
+
+
+def export_phrases(
+    db_path,
+    output_dir,
+    selected_dates,
+    book,
+    filters_shown,
+    per_book=False,
+    per_date=False,
+    custom_folder_name=None,
+    user_timezone=None,
+    include_tags=True,
+    incremental=False,
+    progress=None,
+    cancelled=None,
+    template_dir=None,
+    stats=None,
+    workers=None,
+    aggregate=False,
+    output_format="markdown",
+    search=None,
+    dry_run=False,
+):
+    # stats, if given, is filled with the counts of the export: rows, files
+    # and bytes, and how many files were written, unchanged or deleted.
+    # Large exports into many files are rendered by up to workers processes
+    # (default: one per core). With aggregate, repeated lookups of a word
+    # become one entry; new lookups change earlier entries then, so such an
+    # export is never incremental (unchanged files are still left alone).
+    # Any output_format other than "markdown" is written by export_records,
+    # which only uses the database, output folder, date, book and timezone.
+    # A dry_run plans the export and returns the paths of the files it would
+    # write, without touching the output folder.
+    if output_format != "markdown":
+        return export_records(
+            db_path,
+            output_dir,
+            selected_dates,
+            book,
+            output_format,
+            user_timezone=user_timezone,
+            progress=progress,
+            cancelled=cancelled,
+            stats=stats,
+            search=search,
+            dry_run=dry_run,
+        )
+    try:
+        with span("export", per_book=per_book, per_date=per_date):
+            if not dry_run:
+                os.makedirs(output_dir, exist_ok=True)
+            selected_dates = _selected_dates(selected_dates)
+            templates = load_templates(template_dir)
+
+            # The manifest records what each output file already holds so
+            # the next incremental export only appends the lookups made since.
+            settings = settings_fingerprint(
+                db_path,
+                book,
+                selected_dates,
+                per_book,
+                per_date,
+                include_tags,
+                custom_folder_name,
+                user_timezone,
+                templates.signature,
+                aggregate,
+                search,
+            )
+            with span("manifest.load"):
+                manifest = load_manifest(output_dir)
+            previous_records = (manifest or {}).get("files", {})
+            known_records = {**(manifest or {}).get("kept", {}), **previous_records}
+            same_settings = bool(manifest) and manifest.get("settings") == settings
+            previous_files = None
+            if incremental and not aggregate:
+                previous_files = usable_files(manifest, output_dir, settings)
+            sources = len(database_paths(db_path))
+            if sources > 1 and previous_files:
+                if any("source_marks" not in s for s in previous_files.values()):
+                    # Written before merged databases had a mark each.
+                    previous_files = None
+            if per_book and previous_files:
+                if any(len(state["books"]) != 1 for state in previous_files.values()):
+                    # Written before books whose titles give the same file
+                    # name were told apart; export in full to split them.
+                    previous_files = None
+            if search:
+                _update_search_index(db_path, cancelled)
+            after = None
+            if previous_files:
+                after = high_water_mark(previous_files, sources)
+                if _updated_in_place(
+                    db_path, selected_dates, book, user_timezone, search, after
+                ):
+                    # Appending would keep the old entry of a word looked up
+                    # again; export in full (unchanged notes stay untouched).
+                    previous_files = after = None
+            # Books keep the folders an earlier export with the same settings
+            # gave them.
+            previous_layout = None
+            if per_book and same_settings:
+                previous_layout = previous_slugs(previous_records)
+            files_state = dict(previous_files or {})
+            if stats is None:
+                stats = {}
+            stats.update(new_export_stats())
+
+            query = dict(
+                db_path=db_path,
+                selected_dates=selected_dates,
+                book=book,
+                per_book=per_book,
+                per_date=per_date,
+                custom_folder_name=custom_folder_name,
+                user_timezone=user_timezone,
+                after=after,
+                aggregate=aggregate,
+                search=search,
             )
-            if not selected_dates or local_date in selected_dates:
-                key = ()
-                if per_book:
-                    key += (book_val,)
-                if per_date:
-                    key += (local_date,)
-                grouped[key].append((book_val, word, phrase, local_date))
-
-        written_files = []
-        for key, entries in grouped.items():
-            book_names = sorted(set(entry[0] for entry in entries if entry[0]))
-            date_values = sorted(set(entry[3] for entry in entries if entry[3]))
-
-            markdown = ""
-            if include_tags:
-                markdown += "---\n"
-                markdown += "tags:\n  - english-learning\n  - reading\n"
-                markdown += "book:\n"
-                for b in book_names:
-                    markdown += f'  - "{b}"\n'
-                markdown += f"dates: {', '.join(date_values)}\n"
-                markdown += "pages:\n---\n"
-
-            current_book = None
-            for book_val, word, phrase, _ in entries:
-                if not per_book and book_val != current_book:
-                    markdown += f"\n# {book_val}\n"
-                    current_book = book_val
-                markdown += f"## {word}\n> [!note] Context\n> {phrase}\n"
-
-            if per_book and per_date:
-                folder = os.path.join(target_dir, sanitize_filename(book_names[0]))
-                filename = (
-                    f"{sanitize_filename(date_values[0])}.md"
-                    if len(date_values) == 1
-                    else "vocabulary_builder.md"
+            with span("group"):
+                # Planning and rendering (maybe in other processes) are
+                # separate reads, so both stop at the lookups there are now.
+                query["bound"] = read_bound(db_path)
+                groups = plan_export(**query, previous_layout=previous_layout)
+            stats["total_rows"] = sum(group["count"] for group in groups)
+            if dry_run:
+                stats["files"] = len(groups)
+                paths = [os.path.join(output_dir, group["path"]) for group in groups]
+                return paths, None
+            make_folders(output_dir, groups)
+
+            workers = min(workers or os.cpu_count() or 1, len(groups))
+            if (
+                workers > 1
+                and len(groups) >= PARALLEL_MIN_FILES
+                and stats["total_rows"] >= PARALLEL_MIN_ROWS
+                and not get_database(db_path).snapshot
+            ):
+                # Workers read the database files themselves, so an
+                # in-memory snapshot is always rendered in-process.
+                written_files = _write_parallel(
+                    dict(query, include_tags=include_tags, template_dir=template_dir),
+                    groups,
+                    workers,
+                    output_dir,
+                    files_state,
+                    known_records,
+                    stats,
+                    progress,
+                    cancelled,
                 )
-            elif per_date and custom_folder_name:
-                folder = os.path.join(target_dir, custom_folder_name)
-                filename = (
-                    f"{sanitize_filename(date_values[0])}.md"
-                    if len(date_values) == 1
-                    else "vocabulary_builder.md"
+            else:
+                chunks = render_phrases(
+                    include_tags=include_tags,
+                    files_state=files_state,
+                    stats=stats,
+                    templates=templates,
+                    groups=groups,
+                    **query,
                 )
-            elif per_book:
-                folder = os.path.join(target_dir, sanitize_filename(book_names[0]))
-                filename = f"{sanitize_filename(book_names[0])}.md"
-            elif per_date:
-                folder = os.path.join(target_dir, "by_date")
-                filename = (
-                    f"{sanitize_filename(date_values[0])}.md"
-                    if len(date_values) == 1
-                    else "vocabulary_builder.md"
+                written_files = write_files(
+                    chunks,
+                    output_dir,
+                    files_state,
+                    include_tags=include_tags,
+                    stats=stats,
+                    progress=progress,
+                    cancelled=cancelled,
+                    templates=templates,
+                    previous_records=known_records,
                 )
-            else:
-                folder = target_dir
-                filename = "vocabulary_builder.md"
 
-            os.makedirs(folder, exist_ok=True)
-            filepath = os.path.join(folder, filename)
-            written_files.append(filepath)
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(markdown)
+            # Notes the last export with the same settings wrote that this one
+            # no longer produces, e.g. after a book lost its lookups. Notes
+            # from exports with other settings (another filter, grouping or
+            # template) are never deleted, only kept track of in the manifest.
+            with span("delete"):
+                deleted = set()
+                if same_settings:
+                    stale = {
+                        relpath: record
+                        for relpath, record in previous_records.items()
+                        if relpath not in files_state
+                    }
+                    deleted = set(remove_stale(output_dir, stale))
+                stats["deleted"] = len(deleted)
+                kept = {
+                    relpath: record
+                    for relpath, record in known_records.items()
+                    if relpath not in files_state
+                    and relpath not in deleted
+                    and os.path.exists(os.path.join(output_dir, relpath))
+                }
+            if progress is not None:
+                progress(stats)
+
+            for name in ("rows", "files", "bytes", "written", "unchanged", "deleted"):
+                count(name, stats[name])
+            with span("manifest.save"):
+                save_manifest(output_dir, settings, files_state, kept)
+            return sorted(written_files), None
 
-        conn.close()
-        return sorted(written_files), None
+    except ExportCancelled:
+        # Some files may already be rewritten, so the old manifest no longer
+        # describes the folder; the next export has to be a full one.
+        discard_manifest(output_dir)
+        return None, "Export cancelled"
 
     except Exception as e:
-        logging.error("Error in export_phrases", exc_info=True)
+        logger.error("Error in export_phrases", exc_info=True)
         return None, str(e)
@@ -1,19 +1,149 @@
-from datetime import datetime, timedelta
-
-def build_date_filter(date_vars):
-    selected_dates = [d for d, var in date_vars.items() if var.get() == 1]
-    date_ranges = [
-        (datetime.strptime(d, "%Y-%m-%d"), datetime.strptime(d, "%Y-%m-%d") + timedelta(days=1))
-        for d in selected_dates
-    ]
-    conditions = []
-    params = []
-    for start, end in date_ranges:
-        conditions.append("(a.create_time >= ? AND a.create_time < ?)")
-        params.extend([int(start.timestamp()), int(end.timestamp())])
-    return conditions, params
+import json
+from src.timezones import DayBuckets, day_ranges
+
+MAX_INLINE_RANGES = 50
+MAX_MERGED_DATABASES = 64
+# Lookups of the same word in the same book this close together, from
+# different devices, are one lookup.
+DEDUPE_SECONDS = 60
+
+
+def build_date_filter(selected_dates, user_timezone=None):
+    ranges = day_ranges(selected_dates, user_timezone)
+    if not ranges:
+        return None, []
+    if len(ranges) <= MAX_INLINE_RANGES:
+        condition = " OR ".join(
+            "(a.create_time >= ? AND a.create_time < ?)" for _ in ranges
+        )
+        return f"({condition})", [t for r in ranges for t in r]
+    # Long selections are passed as a single JSON parameter so the query stays
+    # small and never runs into SQLite's variable or expression depth limits.
+    return (
+        """EXISTS (
+            SELECT 1 FROM json_each(?) AS r
+            WHERE a.create_time >= json_extract(r.value, '$[0]')
+              AND a.create_time < json_extract(r.value, '$[1]')
+        )""",
+        [json.dumps(ranges)],
+    )
+
 
 def build_book_filter(book_name):
     if book_name and book_name != "(All)":
         return "b.name = ?", [book_name]
     return None, []
+
+
+def read_row_bound(cursor, schemas=("main",)):
+    # The newest lookup of each database when called, as the highest rowid
+    # per database (numbered as vocabulary_source numbers them) and the
+    # latest create_time. Passed to build_bound_filter, it keeps queries run
+    # one after another, or in other processes, to the same lookups while
+    # KOReader adds new ones or updates old ones in place (a word looked up
+    # again keeps its rowid and gets a later create_time).
+    merged = len(schemas) > 1
+    rowids = []
+    last_time = None
+    for index, schema in enumerate(schemas):
+        cursor.execute(
+            f"SELECT MAX(rowid), MAX(create_time) FROM {schema}.vocabulary"
+        )
+        rowid, create_time = cursor.fetchone()
+        rowid = rowid or 0
+        rowids.append(rowid * MAX_MERGED_DATABASES + index if merged else rowid)
+        if create_time is not None and (last_time is None or create_time > last_time):
+            last_time = create_time
+    return rowids, last_time or 0
+
+
+def build_bound_filter(bound):
+    if bound is None:
+        return None, []
+    rowids, last_time = bound
+    if len(rowids) == 1:
+        return "(a.rowid <= ? AND a.create_time <= ?)", [rowids[0], last_time]
+    cases = " ".join(f"WHEN {index} THEN ?" for index in range(len(rowids)))
+    return (
+        f"(a.rowid <= CASE a.rowid % {MAX_MERGED_DATABASES} {cases} END"
+        " AND a.create_time <= ?)",
+        [*rowids, last_time],
+    )
+
+
+def title_source(schemas=("main",)):
+    # The titles as vocabulary_source joins them, for queries that join
+    # them again after aggregating the lookups.
+    if len(schemas) == 1:
+        return "title"
+    titles = " UNION ALL ".join(
+        f"SELECT id * {MAX_MERGED_DATABASES} + {index} AS id, name"
+        f" FROM {schema}.title"
+        for index, schema in enumerate(schemas)
+    )
+    return f"""(
+            SELECT id, MIN(TRIM(name)) OVER (
+                PARTITION BY LOWER(TRIM(name))
+            ) AS name
+            FROM ({titles})
+        )"""
+
+
+def vocabulary_source(schemas=("main",)):
+    # The FROM clause every lookup query reads, exposing the lookups as "a"
+    # and their titles as "b". With several databases (one per device) the
+    # lookups of all of them are unioned, and ids are renumbered as
+    # id * 64 + the database's position so they stay unique and stable.
+    # Devices that synced the same book log the same lookup, so a lookup is
+    # dropped when an earlier database has the same word in the same book
+    # within DEDUPE_SECONDS; that is a probe of the word index, not a sort.
+    # Titles are matched by trimmed, case-insensitive name.
+    if len(schemas) == 1:
+        return "vocabulary AS a LEFT JOIN title AS b ON a.title_id = b.id"
+    if len(schemas) > MAX_MERGED_DATABASES:
+        raise ValueError(f"At most {MAX_MERGED_DATABASES} databases can be merged")
+
+    lookups = []
+    for index, schema in enumerate(schemas):
+        duplicates = "".join(
+            f"""
+                AND NOT EXISTS (
+                    SELECT 1 FROM {earlier}.vocabulary AS w
+                    LEFT JOIN {earlier}.title AS u ON w.title_id = u.id
+                    WHERE w.word = v.word
+                        AND w.create_time BETWEEN v.create_time - {DEDUPE_SECONDS}
+                            AND v.create_time + {DEDUPE_SECONDS}
+                        AND LOWER(TRIM(u.name)) IS (
+                            SELECT LOWER(TRIM(name)) FROM {schema}.title
+                            WHERE id = v.title_id
+                        )
+                )"""
+            for earlier in schemas[:index]
+        )
+        lookups.append(
+            f"""
+            SELECT v.word, v.create_time, v.prev_context, v.next_context,
+                v.highlight,
+                v.title_id * {MAX_MERGED_DATABASES} + {index} AS title_id,
+                v.rowid * {MAX_MERGED_DATABASES} + {index} AS rowid
+            FROM {schema}.vocabulary AS v
+            WHERE 1{duplicates}"""
+        )
+    return f"""({" UNION ALL ".join(lookups)}) AS a
+        LEFT JOIN {title_source(schemas)} AS b ON a.title_id = b.id"""
+
+
+def build_day_buckets(cursor, user_timezone=None, schemas=("main",)):
+    cursor.execute(
+        "SELECT MIN(low), MAX(high) FROM ("
+        + " UNION ALL ".join(
+            f"SELECT MIN(create_time) AS low, MAX(create_time) AS high"
+            f" FROM {schema}.vocabulary"
+            for schema in schemas
+        )
+        + ")"
+    )
+    start, end = cursor.fetchone()
+    if start is None:
+        start = end = 0
+    return DayBuckets(user_timezone, start, end)
@@ -0,0 +1,179 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+TRACE_ENV = "VOCAB_BUILDER_TRACE"
+
+# None while disabled, so span() and count() cost one global lookup.
+_events = None
+_counters = None
+_lock = threading.Lock()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter_ns() - self.start
+        events = _events
+        if events is not None:
+            events.append(
+                (
+                    self.name,
+                    self.start,
+                    duration,
+                    os.getpid(),
+                    threading.get_ident(),
+                    self.args,
+                )
+            )
+        return False
+
+
+def enabled():
+    return _events is not None
+
+
+def span(name, **args):
+    # Times the with-block as one complete event. Keep spans around batches
+    # and stages, not single rows.
+    if _events is None:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def count(name, value=1):
+    if _counters is None:
+        return
+    with _lock:
+        _counters[name] += value
+
+
+def enable():
+    global _events, _counters
+    if _events is None:
+        _events = []
+        _counters = defaultdict(int)
+
+
+def disable():
+    global _events, _counters
+    _events = _counters = None
+
+
+def collect():
+    # Returns and clears what was recorded so far, in a picklable form that
+    # merge() accepts, e.g. to bring a worker process's timings home.
+    global _events, _counters
+    if _events is None:
+        return {"events": [], "counters": {}}
+    with _lock:
+        collected = {"events": _events, "counters": dict(_counters)}
+        _events = []
+        _counters = defaultdict(int)
+    return collected
+
+
+def merge(collected):
+    if _events is None:
+        return
+    _events.extend(tuple(event) for event in collected["events"])
+    for name, value in collected["counters"].items():
+        count(name, value)
+
+
+def chrome_trace():
+    # Trace Event Format, loadable in chrome://tracing or Perfetto.
+    events = list(_events or ())
+    origin = min((event[1] for event in events), default=0)
+    trace = [
+        {
+            "name": name,
+            "cat": name.split(".", 1)[0],
+            "ph": "X",
+            "ts": (start - origin) / 1000,
+            "dur": duration / 1000,
+            "pid": pid,
+            "tid": tid,
+            "args": args,
+        }
+        for name, start, duration, pid, tid, args in events
+    ]
+    if _counters:
+        end = max((event[1] + event[2] for event in events), default=origin)
+        trace.append(
+            {
+                "name": "counters",
+                "ph": "C",
+                "ts": (end - origin) / 1000,
+                "pid": os.getpid(),
+                "args": dict(_counters),
+            }
+        )
+    return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+
+def write_trace(path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(chrome_trace(), f)
+
+
+def summary():
+    totals = defaultdict(lambda: [0, 0, 0])
+    for name, _, duration, _, _, _ in _events or ():
+        total = totals[name]
+        total[0] += 1
+        total[1] += duration
+        total[2] = max(total[2], duration)
+
+    lines = [f"{'span':24} {'calls':>8} {'total ms':>10} {'mean ms':>9} {'max ms':>9}"]
+    for name, (calls, total, longest) in sorted(
+        totals.items(), key=lambda item: -item[1][1]
+    ):
+        lines.append(
+            f"{name:24} {calls:>8} {total / 1e6:>10.1f} "
+            f"{total / calls / 1e6:>9.3f} {longest / 1e6:>9.1f}"
+        )
+    for name, value in sorted((_counters or {}).items()):
+        lines.append(f"{name:24} {value:>8}")
+    return "\n".join(lines)
+
+
+def report(destination):
+    # destination is "summary" for a table on stderr, or a path for a
+    # Chrome trace file.
+    if destination == "summary":
+        print(summary(), file=sys.stderr)
+    else:
+        write_trace(destination)
+
+
+def enable_from_environment():
+    destination = os.environ.get(TRACE_ENV)
+    if destination:
+        enable()
+        atexit.register(report, destination)
+    return destination
@@ -0,0 +1,95 @@
+import itertools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.exporter import export_phrases
+
+POLL_INTERVAL = 100
+
+
+class ExportScheduler:
+    # Queues export jobs on a worker pool and reports on them through a
+    # thread-safe queue that the Tk loop drains with root.after, so every
+    # callback (and therefore every dialog) runs on the main thread.
+    #
+    # on_event receives dicts with "job", "type" and, depending on the type,
+    # "stats", "files" or "error". Types are "queued", "started",
+    # "progress", "done", "failed" and "cancelled".
+
+    def __init__(self, root, on_event, workers=1):
+        self.root = root
+        self.on_event = on_event
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.events = queue.Queue()
+        self.cancel_events = {}
+        self.ids = itertools.count(1)
+
+        self.root.after(POLL_INTERVAL, self.poll)
+
+    def submit(self, **export_kwargs):
+        job = next(self.ids)
+        cancel_event = threading.Event()
+        self.cancel_events[job] = cancel_event
+        self.events.put({"job": job, "type": "queued"})
+        self.pool.submit(self.run, job, cancel_event, export_kwargs)
+        return job
+
+    def cancel(self, job=None):
+        for job_id, cancel_event in list(self.cancel_events.items()):
+            if job is None or job_id == job:
+                cancel_event.set()
+
+    def active_jobs(self):
+        return len(self.cancel_events)
+
+    def run(self, job, cancel_event, export_kwargs):
+        if cancel_event.is_set():
+            self.events.put({"job": job, "type": "cancelled"})
+            return
+        self.events.put({"job": job, "type": "started"})
+
+        def progress(stats):
+            self.events.put({"job": job, "type": "progress", "stats": dict(stats)})
+
+        stats = {}
+        files, error = export_phrases(
+            progress=progress,
+            cancelled=cancel_event.is_set,
+            stats=stats,
+            **export_kwargs,
+        )
+        if cancel_event.is_set() and files is None:
+            self.events.put({"job": job, "type": "cancelled"})
+        elif error:
+            self.events.put({"job": job, "type": "failed", "error": error})
+        else:
+            self.events.put(
+                {"job": job, "type": "done", "files": files, "stats": stats}
+            )
+
+    def poll(self):
+        events = []
+        try:
+            while True:
+                events.append(self.events.get_nowait())
+        except queue.Empty:
+            pass
+
+        # Only the newest progress report per job in a batch is worth drawing.
+        last_progress = {
+            event["job"]: index
+            for index, event in enumerate(events)
+            if event["type"] == "progress"
+        }
+        for index, event in enumerate(events):
+            if event["type"] == "progress" and last_progress[event["job"]] != index:
+                continue
+            if event["type"] in ("done", "failed", "cancelled"):
+                self.cancel_events.pop(event["job"], None)
+            self.on_event(event)
+        self.root.after(POLL_INTERVAL, self.poll)
+
+    def shutdown(self):
+        self.cancel()
+        self.pool.shutdown(wait=False)
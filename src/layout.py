@@ -0,0 +1,124 @@
+import hashlib
+import os
+import unicodedata
+from collections import Counter
+
+# Room for a collision suffix and ".md" within the 255-byte name limit of
+# common filesystems.
+MAX_SLUG_BYTES = 150
+HASH_LENGTH = 8
+# Names Windows reserves for devices, whatever the extension.
+RESERVED_NAMES = {"CON", "PRN", "AUX", "NUL"} | {
+    f"{device}{n}" for device in ("COM", "LPT") for n in range(1, 10)
+}
+
+
+def slugify(name):
+    # Letters, marks and digits of any script are kept, as are "-" and "_";
+    # spaces become "_" and everything else is dropped, so ASCII titles get
+    # the same names as before non-ASCII titles were supported.
+    if not name:
+        return "unknown"
+    name = unicodedata.normalize("NFC", str(name))
+    slug = "".join(
+        "_" if char == " " else char
+        for char in name
+        if char in " -_" or unicodedata.category(char)[0] in "LMN"
+    )
+    slug = slug.encode("utf-8")[:MAX_SLUG_BYTES].decode("utf-8", errors="ignore")
+    if not slug:
+        return "unknown"
+    if slug.upper() in RESERVED_NAMES:
+        slug += "_"
+    return slug
+
+
+def _name_hash(name, length=HASH_LENGTH):
+    return hashlib.sha1(name.encode("utf-8")).hexdigest()[:length]
+
+
+def previous_slugs(files):
+    # The folder each book had in an earlier export per book, from the files
+    # of its manifest. Files holding several books (written before names
+    # were disambiguated) are left out.
+    slugs = {}
+    for relpath, record in (files or {}).items():
+        books = record.get("books") or ()
+        folder = os.path.dirname(relpath)
+        if len(books) == 1 and folder:
+            slugs.setdefault(books[0], folder)
+    return slugs
+
+
+def book_slugs(books, previous=None):
+    # The folder and file name of each book. Books whose names slug to the
+    # same name, ignoring case (as Windows and macOS do), all get a suffix
+    # from a hash of their full title, so which book gets which name does
+    # not depend on the order they are found in. A book keeps the name an
+    # earlier export gave it (previous, from previous_slugs), so notes do
+    # not move when a second book with a similar title turns up. The names
+    # of earlier books missing from books, e.g. without new lookups in an
+    # incremental export, stay reserved too.
+    previous = previous or {}
+    slugs = {}
+    taken = set()
+    for book in sorted(previous):
+        slug = previous[book]
+        if slug.casefold() not in taken:
+            taken.add(slug.casefold())
+            if book in books:
+                slugs[book] = slug
+
+    fresh = {book: slugify(book) for book in books if book not in slugs}
+    counts = Counter(slug.casefold() for slug in fresh.values())
+    for book in sorted(fresh):
+        slug = fresh[book]
+        if counts[slug.casefold()] > 1 or slug.casefold() in taken:
+            length = HASH_LENGTH
+            slug = f"{fresh[book]}-{_name_hash(book, length)}"
+            while slug.casefold() in taken:
+                length += 2
+                slug = f"{fresh[book]}-{_name_hash(book, length)}"
+        slugs[book] = slug
+        taken.add(slug.casefold())
+    return slugs
+
+
+def output_path(
+    book_names, date_values, per_book, per_date, custom_folder_name, slugs
+):
+    # The path of a file relative to the output folder; slugs maps each book
+    # to its name (see book_slugs) when exporting per book.
+    date_file = (
+        f"{slugify(date_values[0])}.md"
+        if len(date_values) == 1
+        else "vocabulary_builder.md"
+    )
+    if per_book and per_date:
+        return os.path.join(slugs[book_names[0]], date_file)
+    if per_date and custom_folder_name:
+        return os.path.join(custom_folder_name, date_file)
+    if per_book:
+        slug = slugs[book_names[0]]
+        return os.path.join(slug, f"{slug}.md")
+    if per_date:
+        return os.path.join("by_date", date_file)
+    return "vocabulary_builder.md"
+
+
+def plan_layout(groups, per_book, per_date, custom_folder_name, previous=None):
+    # Sets the "path" of every group of a plan in one pass, so names are
+    # settled before anything is written.
+    slugs = {}
+    if per_book:
+        slugs = book_slugs({group["books"][0] for group in groups}, previous)
+    for group in groups:
+        group["path"] = output_path(
+            group["books"],
+            group["dates"],
+            per_book,
+            per_date,
+            custom_folder_name,
+            slugs,
+        )
+    return groups
@@ -0,0 +1,112 @@
+import hashlib
+import os
+import shutil
+import uuid
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def file_record(path, digest):
+    stat = os.stat(path)
+    return {"digest": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def matches_record(path, record):
+    # A file whose size and mtime are what the manifest recorded is taken to
+    # still hold the recorded digest, so it does not have to be read.
+    if not record or not record.get("digest"):
+        return False
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return stat.st_size == record.get("size") and stat.st_mtime_ns == record.get(
+        "mtime_ns"
+    )
+
+
+class OutputFile:
+    # Streams a note to a hidden temp file next to its target while hashing
+    # it. commit() then either drops the temp file, when the target already
+    # holds exactly these bytes, or renames it over the target, so sync
+    # tools only ever see complete files and unchanged notes keep their
+    # mtime. Newlines are translated like a text-mode file would.
+
+    def __init__(self, path, buffering=-1):
+        self.path = path
+        folder, name = os.path.split(path)
+        self.tmp_path = os.path.join(folder, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+        self.hasher = hashlib.sha256()
+        self.translate = os.linesep != "\n"
+        self.out = open(self.tmp_path, "xb", buffering=buffering)
+        self.record = None
+
+    def write(self, text):
+        if self.translate:
+            text = text.replace("\n", os.linesep)
+        data = text.encode("utf-8")
+        self.hasher.update(data)
+        self.out.write(data)
+
+    def commit(self, previous_record=None):
+        self.out.close()
+        digest = self.hasher.hexdigest()
+        unchanged = False
+        if os.path.exists(self.path):
+            if matches_record(self.path, previous_record):
+                unchanged = previous_record["digest"] == digest
+            elif os.path.getsize(self.path) == os.path.getsize(self.tmp_path):
+                unchanged = file_digest(self.path) == digest
+
+        if unchanged:
+            os.remove(self.tmp_path)
+        else:
+            if os.path.exists(self.path):
+                shutil.copymode(self.path, self.tmp_path)
+            os.replace(self.tmp_path, self.path)
+        self.record = file_record(self.path, digest)
+        return "unchanged" if unchanged else "written"
+
+    def discard(self):
+        self.out.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+def remove_stale(output_dir, records):
+    # Deletes notes an earlier export wrote that the current one no longer
+    # produces, but only while they still hold exactly what was written, so
+    # a note the user has edited since is never lost. Folders left empty are
+    # removed too. Returns the relative paths actually deleted.
+    deleted = []
+    for relpath, record in sorted(records.items()):
+        path = os.path.join(output_dir, relpath)
+        digest = (record or {}).get("digest")
+        try:
+            if not digest or not os.path.isfile(path):
+                continue
+            if not matches_record(path, record) and file_digest(path) != digest:
+                continue
+            os.remove(path)
+        except OSError:
+            continue
+        deleted.append(relpath)
+
+        folder = os.path.dirname(path)
+        while os.path.abspath(folder) != os.path.abspath(output_dir):
+            try:
+                os.rmdir(folder)
+            except OSError:
+                break
+            folder = os.path.dirname(folder)
+    return deleted
@@ -1,26 +1,154 @@
 import tkinter as tk
-from tkinter.scrolledtext import ScrolledText
+from tkinter import ttk
 from src.window_utils import set_window_icon, center_window
 
+PAGE_SIZE = 200
+MAX_LOADED_PAGES = 3
+EDGE_FRACTION = 0.15
 
-def show_preview(markdown_text, title="Markdown Preview", on_close=None):
-    try:
-        preview_window = tk.Toplevel()
-        preview_window.title(title)
-        preview_window.geometry("800x600")
 
-        set_window_icon(preview_window)
+class PreviewWindow:
+    # Shows a PreviewPages result one output file at a time. Only a sliding
+    # window of at most MAX_LOADED_PAGES pages is kept in the text widget:
+    # scrolling close to either edge renders the neighbouring page and drops
+    # the one furthest away.
+
+    def __init__(self, pages, title="Markdown Preview", on_close=None):
+        self.pages = pages
+        self.group_index = None
+        self.loaded = []
+        self.check_pending = False
+
+        self.window = tk.Toplevel()
+        self.window.title(title)
+        self.window.geometry("1000x600")
+        set_window_icon(self.window)
+
+        paned = ttk.PanedWindow(self.window, orient="horizontal")
+        paned.pack(expand=True, fill="both")
+
+        sidebar = ttk.Frame(paned)
+        ttk.Label(
+            sidebar,
+            text=f"{len(pages.groups)} files, {pages.total_entries} entries",
+            anchor="w",
+        ).pack(fill="x", padx=5, pady=5)
+        self.file_list = tk.Listbox(sidebar, exportselection=False, width=35)
+        file_scroll = ttk.Scrollbar(
+            sidebar, orient="vertical", command=self.file_list.yview
+        )
+        self.file_list.configure(yscrollcommand=file_scroll.set)
+        file_scroll.pack(side="right", fill="y")
+        self.file_list.pack(side="left", expand=True, fill="both")
+        for group in pages.groups:
+            self.file_list.insert("end", f"{group['path']} ({group['count']})")
+        self.file_list.bind("<<ListboxSelect>>", self.on_file_selected)
+        paned.add(sidebar, weight=1)
 
-        text_box = ScrolledText(preview_window, wrap="word")
-        text_box.insert("1.0", markdown_text)
-        text_box.config(state="disabled")
-        text_box.pack(expand=True, fill="both")
+        content = ttk.Frame(paned)
+        self.status = ttk.Label(content, anchor="w")
+        self.status.pack(fill="x", padx=5, pady=5)
+        self.text_scroll = ttk.Scrollbar(content, orient="vertical")
+        self.text = tk.Text(
+            content, wrap="word", yscrollcommand=self.on_text_scrolled
+        )
+        self.text_scroll.configure(command=self.text.yview)
+        self.text_scroll.pack(side="right", fill="y")
+        self.text.pack(side="left", expand=True, fill="both")
+        paned.add(content, weight=3)
 
-        center_window(preview_window)
+        center_window(self.window)
 
         if on_close:
-            preview_window.protocol(
-                "WM_DELETE_WINDOW", lambda: (on_close(), preview_window.destroy())
+            self.window.protocol(
+                "WM_DELETE_WINDOW", lambda: (on_close(), self.window.destroy())
             )
+
+        if pages.groups:
+            self.file_list.selection_set(0)
+            self.open_group(0)
+        else:
+            self.status.config(text="Nothing to export with the current filters.")
+
+    def page_count(self):
+        count = self.pages.groups[self.group_index]["count"]
+        return max((count + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+
+    def render_page(self, page):
+        return self.pages.render(self.group_index, page * PAGE_SIZE, PAGE_SIZE)
+
+    def on_file_selected(self, event):
+        selection = self.file_list.curselection()
+        if selection and selection[0] != self.group_index:
+            self.open_group(selection[0])
+
+    def open_group(self, index):
+        self.group_index = index
+        self.loaded = []
+        self.text.config(state="normal")
+        self.text.delete("1.0", "end")
+        self.text.config(state="disabled")
+        self.append_page()
+        if self.page_count() > 1:
+            self.append_page()
+        self.text.yview_moveto(0)
+        self.update_status()
+
+    def append_page(self):
+        page = self.loaded[-1][0] + 1 if self.loaded else 0
+        chunk = self.render_page(page)
+        self.text.config(state="normal")
+        self.text.insert("end", chunk)
+        self.loaded.append((page, chunk.count("\n")))
+        if len(self.loaded) > MAX_LOADED_PAGES:
+            _, lines = self.loaded.pop(0)
+            self.text.mark_set("view", "@0,0")
+            self.text.delete("1.0", f"{lines + 1}.0")
+            self.text.yview("view")
+        self.text.config(state="disabled")
+
+    def prepend_page(self):
+        page = self.loaded[0][0] - 1
+        chunk = self.render_page(page)
+        self.text.config(state="normal")
+        self.text.mark_set("view", "@0,0")
+        self.text.insert("1.0", chunk)
+        self.loaded.insert(0, (page, chunk.count("\n")))
+        if len(self.loaded) > MAX_LOADED_PAGES:
+            self.loaded.pop()
+            start = 1 + sum(lines for _, lines in self.loaded)
+            self.text.delete(f"{start}.0", "end")
+        self.text.yview("view")
+        self.text.config(state="disabled")
+
+    def on_text_scrolled(self, first, last):
+        self.text_scroll.set(first, last)
+        if not self.check_pending:
+            self.check_pending = True
+            self.window.after_idle(self.check_edges)
+
+    def check_edges(self):
+        self.check_pending = False
+        if self.group_index is None or not self.loaded:
+            return
+        first, last = self.text.yview()
+        if last >= 1 - EDGE_FRACTION and self.loaded[-1][0] < self.page_count() - 1:
+            self.append_page()
+        elif first <= EDGE_FRACTION and self.loaded[0][0] > 0:
+            self.prepend_page()
+        self.update_status()
+
+    def update_status(self):
+        group = self.pages.groups[self.group_index]
+        first = self.loaded[0][0] * PAGE_SIZE + 1
+        last = min((self.loaded[-1][0] + 1) * PAGE_SIZE, group["count"])
+        self.status.config(
+            text=f"{group['path']}: entries {first}-{last} of {group['count']}"
+        )
+
+
+def show_preview(pages, title="Markdown Preview", on_close=None):
+    try:
+        return PreviewWindow(pages, title=title, on_close=on_close)
     except Exception as e:
         print(f"Error displaying preview: {e}")
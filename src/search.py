@@ -0,0 +1,205 @@
+import hashlib
+import os
+import sqlite3
+from urllib.request import pathname2url
+
+from src.config import cache_dir
+from src.database import database_key, read_only_uri
+from src.filters import MAX_MERGED_DATABASES
+from src.instrumentation import span
+from src.worker import Cancelled, cancellable
+
+# Bump when the index layout changes; older index files are then rebuilt.
+SEARCH_INDEX_VERSION = 2
+INDEX_COLUMNS = ("word", "prev_context", "highlight", "next_context")
+# Rows of a contentless index can only be deleted by rowid from SQLite 3.43.
+CONTENTLESS_DELETE = sqlite3.sqlite_version_info >= (3, 43, 0)
+
+
+def index_path(db_path):
+    key = "\n".join(database_key(db_path))
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir(), f"search-{digest}.sqlite3")
+
+
+def _lookup_id(sources, position):
+    # The ids vocabulary_source gives lookups, so index hits match a.rowid.
+    if sources == 1:
+        return "rowid"
+    return f"rowid * {MAX_MERGED_DATABASES} + {position}"
+
+
+def _create_index(conn):
+    columns = ", ".join(INDEX_COLUMNS)
+    # Contentless: the index only maps terms to lookup ids, the text stays
+    # in the user's database. Prefix queries are fast enough without prefix
+    # indexes, which would more than double its size.
+    delete = ", contentless_delete=1" if CONTENTLESS_DELETE else ""
+    conn.execute(
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS lookups USING fts5(
+            {columns}, content=''{delete},
+            tokenize='unicode61 remove_diacritics 2'
+        )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS sources (
+            position INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            last_rowid INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            last_time INTEGER
+        )"""
+    )
+
+
+def _can_delete(conn):
+    sql = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'lookups'"
+    ).fetchone()[0]
+    return "contentless_delete" in sql
+
+
+def update_index(db_path, cancelled=None):
+    # Brings the full-text index of db_path's lookup contexts up to date. It
+    # lives in a sidecar database in the cache folder, never in the user's
+    # file. KOReader appends new lookups, and updates the row of a word
+    # looked up again in place: same rowid, with a later create_time and the
+    # new context. So each update indexes the rows after the last rowid seen
+    # and reindexes earlier rows created after the last create_time seen.
+    # When rows below the last rowid were deleted or a source path changed,
+    # the index is rebuilt instead, as it is for updated rows when the index
+    # cannot delete them (SQLite before 3.43). Raises Cancelled when
+    # cancelled() turns true; the index is then left as it was.
+    paths = database_key(db_path)
+    path = index_path(db_path)
+    conn = sqlite3.connect("file:" + pathname2url(path), uri=True)
+    try:
+        cancellable(conn, cancelled)
+        with span("search.index"), conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != SEARCH_INDEX_VERSION:
+                conn.execute("DROP TABLE IF EXISTS lookups")
+                conn.execute("DROP TABLE IF EXISTS sources")
+                conn.execute(f"PRAGMA user_version = {SEARCH_INDEX_VERSION}")
+            _create_index(conn)
+            for position, source_path in enumerate(paths):
+                conn.execute(
+                    f"ATTACH DATABASE ? AS source{position}",
+                    (read_only_uri(source_path),),
+                )
+
+            indexed = {
+                position: (source_path, last_rowid, row_count, last_time)
+                for position, source_path, last_rowid, row_count, last_time in (
+                    conn.execute(
+                        "SELECT position, path, last_rowid, row_count, last_time"
+                        " FROM sources"
+                    )
+                )
+            }
+            can_delete = _can_delete(conn)
+            rebuild = set(indexed) - set(range(len(paths)))
+            newest = {}
+            for position, source_path in enumerate(paths):
+                previous = indexed.get(position)
+                if previous is None:
+                    continue
+                _, last_rowid, row_count, last_time = previous
+                kept, changed, newest[position] = conn.execute(
+                    "SELECT COUNT(*), COUNT(CASE WHEN create_time > ? THEN 1 END),"
+                    f" MAX(create_time) FROM source{position}.vocabulary"
+                    " WHERE rowid <= ?",
+                    (last_time, last_rowid),
+                ).fetchone()
+                if (
+                    previous[0] != source_path
+                    or kept != row_count
+                    or (changed and not can_delete)
+                ):
+                    rebuild.add(position)
+            if rebuild:
+                conn.execute("INSERT INTO lookups(lookups) VALUES ('delete-all')")
+                conn.execute("DELETE FROM sources")
+                indexed = {}
+                newest = {}
+
+            columns = ", ".join(INDEX_COLUMNS)
+            for position, source_path in enumerate(paths):
+                _, last_rowid, row_count, last_time = indexed.get(
+                    position, (None, 0, 0, None)
+                )
+                schema = f"source{position}"
+                lookup_id = _lookup_id(len(paths), position)
+                if last_time is not None:
+                    updated = (
+                        f" FROM {schema}.vocabulary"
+                        " WHERE rowid <= ? AND create_time > ?"
+                    )
+                    conn.execute(
+                        f"DELETE FROM lookups WHERE rowid IN"
+                        f" (SELECT {lookup_id}{updated})",
+                        (last_rowid, last_time),
+                    )
+                    conn.execute(
+                        f"INSERT INTO lookups(rowid, {columns})"
+                        f" SELECT {lookup_id}, {columns}{updated}",
+                        (last_rowid, last_time),
+                    )
+                new_last, added, new_time = conn.execute(
+                    f"SELECT MAX(rowid), COUNT(*), MAX(create_time)"
+                    f" FROM {schema}.vocabulary WHERE rowid > ?",
+                    (last_rowid,),
+                ).fetchone()
+                if added:
+                    conn.execute(
+                        f"INSERT INTO lookups(rowid, {columns})"
+                        f" SELECT {lookup_id}, {columns}"
+                        f" FROM {schema}.vocabulary WHERE rowid > ?",
+                        (last_rowid,),
+                    )
+                times = [t for t in (newest.get(position), new_time) if t is not None]
+                conn.execute(
+                    "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)",
+                    (
+                        position,
+                        source_path,
+                        new_last if added else last_rowid,
+                        row_count + added,
+                        max(times) if times else None,
+                    ),
+                )
+    except sqlite3.OperationalError:
+        if cancelled is not None and cancelled():
+            raise Cancelled()
+        raise
+    finally:
+        conn.close()
+    return path
+
+
+def search_filter(conn, db_path, expression):
+    # The WHERE condition for lookups matching expression, an FTS5 query
+    # such as 'serendipit*', '"make up"' or 'word: re* NOT highlight: red'.
+    # The index is attached to conn, read-only, on first use.
+    attached = [row[1] for row in conn.execute("PRAGMA database_list")]
+    if "search" not in attached:
+        conn.execute(
+            "ATTACH DATABASE ? AS search", (read_only_uri(index_path(db_path)),)
+        )
+    return (
+        "a.rowid IN (SELECT rowid FROM search.lookups WHERE lookups MATCH ?)",
+        [expression],
+    )
+
+
+def count_matches(db_path, expression, cancelled=None):
+    # Updates the index and counts the indexed lookups matching expression,
+    # which also reports a malformed expression as an sqlite3 error.
+    path = update_index(db_path, cancelled)
+    conn = sqlite3.connect(read_only_uri(path), uri=True)
+    try:
+        return conn.execute(
+            "SELECT COUNT(*) FROM lookups WHERE lookups MATCH ?", (expression,)
+        ).fetchone()[0]
+    finally:
+        conn.close()
@@ -0,0 +1,92 @@
+import csv
+import html
+import io
+import re
+from json.encoder import encode_basestring
+
+# Machine-readable alternatives to the Markdown notes: one record per
+# lookup, written straight from the query rows without any templates.
+# Each render function turns a batch of (book, word, highlight,
+# prev_context, next_context, create_time) rows and their local dates into
+# text.
+RECORD_FIELDS = (
+    "book",
+    "word",
+    "highlight",
+    "prev_context",
+    "next_context",
+    "create_time",
+    "date",
+)
+# Anki reads these header lines to set up the import; fields are HTML and
+# the last column holds the note's tags.
+ANKI_HEADER = (
+    "#separator:tab\n"
+    "#html:true\n"
+    "#columns:Word\tContext\tBook\tDate\tTags\n"
+    "#tags column:5\n"
+)
+
+
+def _json(text):
+    return "null" if text is None else encode_basestring(text)
+
+
+def ndjson_records(rows, days):
+    # Formatted directly rather than through json.dumps of a dict per row,
+    # which took longer than rendering the Markdown.
+    lines = []
+    for row, day in zip(rows, days):
+        book, word, highlight, prev_context, next_context, create_time = row
+        lines.append(
+            f'{{"book": {_json(book)}, "word": {_json(word)}, '
+            f'"highlight": {_json(highlight)}, '
+            f'"prev_context": {_json(prev_context)}, '
+            f'"next_context": {_json(next_context)}, '
+            f'"create_time": {create_time}, "date": "{day}"}}\n'
+        )
+    return "".join(lines)
+
+
+def csv_records(rows, days):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(
+        (*row, day) for row, day in zip(rows, days)
+    )
+    return buffer.getvalue()
+
+
+def _anki_html(text):
+    return html.escape(text or "").replace("\t", " ").replace("\n", "<br>")
+
+
+def anki_tag(book):
+    # Anki tags cannot hold spaces or quotes.
+    return re.sub(r"[\s\"]+", "_", book.strip())
+
+
+def anki_records(rows, days):
+    lines = []
+    for (book, word, highlight, prev_context, next_context, _), day in zip(
+        rows, days
+    ):
+        context = (
+            f"{_anki_html(prev_context)}<b>{_anki_html(highlight or word)}</b>"
+            f"{_anki_html(next_context)}"
+        )
+        lines.append(
+            f"{_anki_html(word)}\t{context}\t{_anki_html(book)}\t{day}"
+            f"\t{anki_tag(book)}\n"
+        )
+    return "".join(lines)
+
+
+RECORD_FORMATS = {
+    "ndjson": {"extension": ".ndjson", "header": "", "render": ndjson_records},
+    "csv": {
+        "extension": ".csv",
+        "header": ",".join(RECORD_FIELDS) + "\n",
+        "render": csv_records,
+    },
+    "anki": {"extension": ".tsv", "header": ANKI_HEADER, "render": anki_records},
+}
@@ -0,0 +1,186 @@
+import hashlib
+import os
+from string import Formatter
+
+DEFAULT_TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "templates")
+TEMPLATE_FIELDS = {
+    "front_matter": ("books", "dates"),
+    "book_header": ("book",),
+    "entry": ("book", "word", "phrase", "day"),
+    "word_entry": ("book", "word", "phrases", "lookups", "first_day", "last_day"),
+}
+APPENDED_TEMPLATES = ("front_matter", "book_header", "entry")
+# Fields holding a list, which a line can be repeated for with {name*}.
+LIST_FIELDS = {"books", "dates", "phrases"}
+
+_compiled = {}
+
+
+class TemplateError(ValueError):
+    pass
+
+
+def _expression(text, fields, name):
+    # Turns template text into a single f-string expression over the field
+    # names: literal text is emitted with repr() and fields are checked
+    # against the allowed names, so nothing from the file is ever evaluated.
+    # A field written as {name*} marks the text for repetition and is
+    # returned as the repeated field.
+    pieces = []
+    used = []
+    repeated = None
+    try:
+        parsed = list(Formatter().parse(text))
+    except ValueError as e:
+        raise TemplateError(f"{name} template: {e}")
+    for literal, field, spec, conversion in parsed:
+        if literal:
+            pieces.append(repr(literal))
+        if field is None:
+            continue
+        if field.endswith("*"):
+            field = field[:-1]
+            if repeated not in (None, field):
+                raise TemplateError(f"{name} template repeats two fields on one line")
+            repeated = field
+        if field not in fields:
+            expected = ", ".join(f"{{{f}}}" for f in fields)
+            raise TemplateError(
+                f"unknown field {{{field}}} in {name} template, expected {expected}"
+            )
+        if conversion not in (None, "r", "s", "a") or any(
+            c in spec for c in "{}'\"\\\n"
+        ):
+            raise TemplateError(f"unsupported format in {name} template: {{{field}}}")
+        used.append(field)
+        conversion = f"!{conversion}" if conversion else ""
+        spec = f":{spec}" if spec else ""
+        pieces.append(f"f'{{{field}{conversion}{spec}}}'")
+    return " ".join(pieces) or "''", repeated, used
+
+
+def _compile(text, fields, name):
+    # A function taking TEMPLATE_FIELDS positionally whose body is a single
+    # f-string; templates compiled this way cannot repeat lines.
+    expression, repeated, _ = _expression(text, fields, name)
+    if repeated:
+        raise TemplateError(f"{{{repeated}*}} is not allowed in {name} template")
+    source = f"lambda {', '.join(fields)}: {expression}"
+    return eval(compile(source, f"<{name} template>", "eval"))
+
+
+def _compile_lines(text, fields, name):
+    # Like _compile, for templates whose lines may be repeated once per item
+    # of a list field. List fields outside a repeated line are joined with
+    # ", ". The repeated line becomes a comprehension over the list, so the
+    # whole template is still one compiled function. Also returns the fields
+    # each line uses.
+    lists = [field for field in fields if field in LIST_FIELDS]
+    parts = []
+    used_by_line = []
+    for line in text.splitlines(keepends=True):
+        expression, repeated, used = _expression(line, fields, name)
+        if repeated is None:
+            parts.append(expression)
+        elif repeated in lists:
+            parts.append(
+                f"''.join([{expression} for {repeated} in {repeated}__items])"
+            )
+        else:
+            raise TemplateError(f"{{{repeated}}} in {name} template is not a list")
+        used_by_line.append(used)
+
+    body = " + ".join(f"({part})" for part in parts) or "''"
+    if lists:
+        joined = ", ".join(f"{field}__items, {field}" for field in lists)
+        values = ", ".join(f"{field}, ', '.join({field})" for field in lists)
+        body = f"(lambda {joined}: {body})({values})"
+    source = f"lambda {', '.join(fields)}: {body}"
+    return eval(compile(source, f"<{name} template>", "eval")), used_by_line
+
+
+def _is_continuation(line):
+    return line[:1] in (" ", "\t") or line.startswith("- ")
+
+
+def _yaml_blocks(text):
+    # Splits front matter into top-level "key:" blocks, each with the
+    # indented lines that follow it. Lines outside any key get key None.
+    blocks = []
+    for line in text.splitlines(keepends=True):
+        if blocks and _is_continuation(line):
+            blocks[-1][1].append(line)
+            continue
+        key = line.split(":", 1)[0] if ":" in line else None
+        blocks.append((key, [line]))
+    return [(key, "".join(lines)) for key, lines in blocks]
+
+
+class MarkdownTemplates:
+    # The pieces of an exported note, compiled once per set of sources into
+    # functions taking their fields positionally in TEMPLATE_FIELDS order.
+    # Lines of front_matter and word_entry (one entry for all lookups of a
+    # word) can repeat once per book, date or context.
+
+    def __init__(self, sources):
+        # Identifies the layout that incremental exports append to;
+        # word_entry is left out, as aggregated exports are never appended to.
+        self.signature = hashlib.sha1(
+            "\0".join(sources[name] for name in APPENDED_TEMPLATES).encode("utf-8")
+        ).hexdigest()
+
+        for name in ("entry", "book_header"):
+            setattr(self, name, _compile(sources[name], TEMPLATE_FIELDS[name], name))
+        self.word_entry, _ = _compile_lines(
+            sources["word_entry"], TEMPLATE_FIELDS["word_entry"], "word_entry"
+        )
+
+        self.front_matter, used_by_line = _compile_lines(
+            sources["front_matter"], TEMPLATE_FIELDS["front_matter"], "front_matter"
+        )
+        # Keys whose value comes from a field are the ones an incremental
+        # export has to rewrite; everything else is left as the user edited it.
+        self.dynamic_keys = set()
+        key = None
+        for line, used in zip(sources["front_matter"].splitlines(), used_by_line):
+            if not _is_continuation(line):
+                key = line.split(":", 1)[0] if ":" in line else None
+            if used:
+                self.dynamic_keys.add(key)
+
+    def update_front_matter(self, text, book_names, date_values):
+        if not self.dynamic_keys or not text.startswith("---\n"):
+            return text
+        end = text.find("\n---\n", 3)
+        if end == -1:
+            return text
+
+        fresh = {
+            key: block
+            for key, block in _yaml_blocks(self.front_matter(book_names, date_values))
+            if key in self.dynamic_keys
+        }
+        parts = [
+            fresh.get(key, block) for key, block in _yaml_blocks(text[: end + 1])
+        ]
+        return "".join(parts) + text[end + 1 :]
+
+
+def load_templates(template_dir=None):
+    # Missing files in template_dir fall back to the bundled defaults, so a
+    # vault can override just the entry layout.
+    if template_dir and not os.path.isdir(template_dir):
+        raise TemplateError(f"template folder not found: {template_dir}")
+    sources = {}
+    for name in TEMPLATE_FIELDS:
+        path = os.path.join(template_dir or DEFAULT_TEMPLATE_DIR, f"{name}.md")
+        if not os.path.exists(path):
+            path = os.path.join(DEFAULT_TEMPLATE_DIR, f"{name}.md")
+        with open(path, "r", encoding="utf-8") as f:
+            sources[name] = f.read()
+
+    key = tuple(sources[name] for name in TEMPLATE_FIELDS)
+    templates = _compiled.get(key)
+    if templates is None:
+        templates = _compiled[key] = MarkdownTemplates(sources)
+    return templates
@@ -0,0 +1,233 @@
+import sys
+import time
+from bisect import bisect_right
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from zoneinfo import ZoneInfo
+
+from tzlocal import get_localzone_name
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SCAN_STEP = 12 * 3600
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+UNIX_EPOCH = datetime(1970, 1, 1)
+
+
+def _seconds(dt):
+    # A datetime's fields as seconds since the epoch, ignoring its tzinfo.
+    return (dt.replace(tzinfo=None) - UNIX_EPOCH) // timedelta(seconds=1)
+
+
+class SystemTimezone(tzinfo):
+    # The C library's local time, for a system whose zone has no IANA name.
+    # It follows daylight saving time like the system clock does, and unlike
+    # a fixed offset its name stays the same all year, so the catalog cache
+    # and export manifests keyed by it stay valid.
+    key = "local"
+
+    def _offset(self, timestamp):
+        return time.localtime(timestamp).tm_gmtoff
+
+    def utcoffset(self, dt):
+        # The offsets a day either side of the wall time are the candidates;
+        # an ambiguous time takes the first (fold=0) or second, and a time
+        # skipped by a transition the offset before it (fold=0) or after.
+        wall = _seconds(dt.replace(fold=0))
+        before = self._offset(wall - 86400)
+        after = self._offset(wall + 86400)
+        valid = [o for o in (before, after) if self._offset(wall - o) == o]
+        if len(valid) == 2 and before != after:
+            offset = valid[dt.fold]
+        elif valid:
+            offset = valid[0]
+        else:
+            offset = after if dt.fold else before
+        return timedelta(seconds=offset)
+
+    def dst(self, dt):
+        return None
+
+    def tzname(self, dt):
+        utc = _seconds(dt) - int(self.utcoffset(dt).total_seconds())
+        return time.localtime(utc).tm_zone
+
+    def fromutc(self, dt):
+        offset = timedelta(seconds=self._offset(_seconds(dt)))
+        local = dt + offset
+        # The second of two equal wall times is marked by fold.
+        if self.utcoffset(local) != offset:
+            local = local.replace(fold=1)
+        return local
+
+    def __repr__(self):
+        return "SystemTimezone()"
+
+
+def local_timezone():
+    # The IANA zone the system is set to, so days follow its daylight saving
+    # rules for every date. tzlocal reads TZ and /etc/localtime, and maps the
+    # Windows zone from the registry; the tzdata package supplies the zone
+    # files Windows lacks.
+    try:
+        name = get_localzone_name()
+        if name:
+            return ZoneInfo(name)
+    except (LookupError, ValueError, OSError):
+        pass
+    return SystemTimezone()
+
+
+def local_date(timestamp, user_timezone):
+    return (
+        datetime.fromtimestamp(timestamp, tz=timezone.utc)
+        .astimezone(user_timezone)
+        .date()
+    )
+
+
+def utc_offset(timestamp, user_timezone):
+    local = datetime.fromtimestamp(timestamp, tz=timezone.utc).astimezone(user_timezone)
+    return int(local.utcoffset().total_seconds())
+
+
+def offset_segments(user_timezone, start, end):
+    # Returns [(from_timestamp, offset_seconds), ...] covering start..end.
+    # Offsets are sampled every SCAN_STEP seconds and each change is then
+    # narrowed down to the exact second with a binary search.
+    start, end = int(start), int(end)
+    current = utc_offset(start, user_timezone)
+    segments = [(start, current)]
+    t = start
+    while t < end:
+        step_end = min(t + SCAN_STEP, end)
+        offset = utc_offset(step_end, user_timezone)
+        if offset != current:
+            lo, hi = t, step_end
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if utc_offset(mid, user_timezone) == current:
+                    lo = mid
+                else:
+                    hi = mid
+            segments.append((hi, offset))
+            current = offset
+        t = step_end
+    return segments
+
+
+def day_number_sql(segments, column="a.create_time"):
+    # Days since 1970-01-01 in local time. Integer arithmetic is much cheaper
+    # for SQLite than date(), and the numbers map back to ISO dates through
+    # DayBuckets.name.
+    if len(segments) == 1:
+        offset = str(segments[0][1])
+    else:
+        cases = " ".join(
+            f"WHEN {column} < {transition} THEN {previous[1]}"
+            for previous, (transition, _) in zip(segments, segments[1:])
+        )
+        offset = f"CASE {cases} ELSE {segments[-1][1]} END"
+    return f"(({column} + {offset}) / 86400)"
+
+
+def local_midnight(day, user_timezone):
+    if isinstance(day, str):
+        day = datetime.strptime(day, "%Y-%m-%d").date()
+    return int(
+        datetime(day.year, day.month, day.day, tzinfo=user_timezone).timestamp()
+    )
+
+
+def day_ranges(dates, user_timezone):
+    # Converts ISO dates into the smallest list of [start, end) epoch ranges,
+    # merging consecutive days so a month of selected days is one range.
+    ranges = []
+    for day in sorted(set(dates)):
+        parsed = datetime.strptime(day, "%Y-%m-%d").date()
+        start = local_midnight(parsed, user_timezone)
+        end = local_midnight(parsed + timedelta(days=1), user_timezone)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+    return ranges
+
+
+class DayBuckets:
+    # Maps lookup timestamps to local ISO dates for one start..end range.
+    # A timestamp's day is (timestamp + offset) // 86400 with the offset of
+    # its segment from offset_segments, exactly as day_number_sql computes it,
+    # so Python and SQL always agree, even in zones where a transition at
+    # midnight repeats or skips it. The day names are shared, interned
+    # strings. Rows mostly arrive in time order, so the span of the last day
+    # hit is checked before bisecting.
+
+    def __init__(self, user_timezone, start, end):
+        start, end = int(start), int(end)
+        self.user_timezone = user_timezone
+        self.segments = offset_segments(user_timezone, start, end)
+        self.transitions = [t for t, _ in self.segments[1:]]
+        self.offsets = [offset for _, offset in self.segments]
+
+        # A transition can move the day back, so the first day is the
+        # earliest any segment starts on.
+        self.first_number = min(
+            (t + offset) // 86400 for t, offset in self.segments
+        )
+        last_number = max(self.first_number, (end + self.offsets[-1]) // 86400)
+        self.names = [
+            sys.intern(date.fromordinal(EPOCH_ORDINAL + number).isoformat())
+            for number in range(self.first_number, last_number + 1)
+        ]
+        if numpy:
+            self.transition_array = numpy.array(self.transitions, dtype=numpy.int64)
+            self.offset_array = numpy.array(self.offsets, dtype=numpy.int64)
+        else:
+            self.transition_array = None
+
+        self.low = self.high = None
+        self.current = None
+
+    def sql(self, column="a.create_time"):
+        return day_number_sql(self.segments, column)
+
+    def name(self, day_number):
+        index = day_number - self.first_number
+        if 0 <= index < len(self.names):
+            return self.names[index]
+        return date.fromordinal(EPOCH_ORDINAL + day_number).isoformat()
+
+    def day(self, timestamp):
+        if self.low is not None and self.low <= timestamp < self.high:
+            return self.current
+        # Timestamps before the first transition take the first offset and
+        # those after the last the last one, as in day_number_sql.
+        segment = bisect_right(self.transitions, timestamp)
+        offset = self.offsets[segment]
+        number = (timestamp + offset) // 86400
+        # The span of timestamps with the same segment and day.
+        low = number * 86400 - offset
+        high = low + 86400
+        if segment > 0:
+            low = max(low, self.transitions[segment - 1])
+        if segment < len(self.transitions):
+            high = min(high, self.transitions[segment])
+        self.low, self.high = low, high
+        self.current = self.name(number)
+        return self.current
+
+    def days(self, timestamps):
+        if self.transition_array is None or not timestamps:
+            return [self.day(t) for t in timestamps]
+        stamps = numpy.array(timestamps, dtype=numpy.int64)
+        segments = numpy.searchsorted(self.transition_array, stamps, side="right")
+        indexes = (stamps + self.offset_array[segments]) // 86400 - self.first_number
+        names = self.names
+        count = len(names)
+        return [
+            names[i] if 0 <= i < count else self.day(t)
+            for i, t in zip(indexes.tolist(), timestamps)
+        ]
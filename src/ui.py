@@ -1,19 +1,24 @@
 import os
-import sqlite3
-from datetime import datetime, timedelta, timezone
+import queue
+import threading
+import time
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import W, NW, EW, BOTH
-from tkinter import filedialog, Canvas, Frame, Scrollbar, messagebox
+from tkinter import filedialog, Canvas, messagebox
 from tkinter.simpledialog import askstring
-import tempfile
-import shutil
 import subprocess
-import threading
 from src.config import load_theme, save_theme
-from src.exporter import export_phrases
-from src.preview import show_preview
 from src.window_utils import set_window_icon, center_window
-import time
+from src.worker import QueryWorker
+
+FILTER_DEBOUNCE_MS = 150
+WATCH_POLL_MS = 500
+OUTPUT_FORMATS = {
+    "Markdown": "markdown",
+    "NDJSON": "ndjson",
+    "CSV": "csv",
+    "Anki (TSV)": "anki",
+}
 
 
 class SQLitePhraseExporter:
@@ -25,25 +30,47 @@ class SQLitePhraseExporter:
         set_window_icon(self.root)
 
         self.db_path = ""
+        self.catalog = None
         self.output_dir = ""
-        self.date_vars = {}
+        self.template_dir = None
         self.book_var = ttk.StringVar()
         self.filters_shown = False
         self.style = ttk.Style()
-        self.selected_dates_cache = set()
-        self.select_all_checked = False
-        self.select_all_var = None
+        self.date_filter_shown = False
         self.include_tags_var = ttk.IntVar(value=1)
+        self.incremental_var = ttk.IntVar(value=0)
+        self.aggregate_var = ttk.IntVar(value=0)
+        self.export_per_book_var = ttk.IntVar(value=0)
+        self.export_per_date_var = ttk.IntVar(value=0)
+        self.snapshot_var = ttk.IntVar(value=0)
+        self.watch_var = ttk.IntVar(value=0)
+        self.format_var = ttk.StringVar(value="Markdown")
+        self.search_var = ttk.StringVar()
+        # The filter panel, date selector and export scheduler are built on
+        # first use, and the modules behind them (the exporter, catalog and
+        # SQLite) are imported there too, so the window paints sooner.
+        self.filter_frame = None
+        self.date_selector = None
+        self.scheduler = None
 
         self.load_theme()
         self.create_widgets()
+        self.worker = QueryWorker(self.root, on_busy=self.show_busy)
+        self.export_jobs = {}
+        # Changes reported by the watcher thread, drained on the Tk thread.
+        self.watch_events = queue.Queue()
+        self.watch_stop = None
+        self.watch_folder_name = None
+        self.watch_polling = False
+        self.watch_jobs = set()
 
     def set_icon_for_toplevel(self, toplevel):
         set_window_icon(toplevel)
 
     def load_theme(self):
         theme = load_theme()
-        self.style.theme_use(theme)
+        if self.style.theme.name != theme:
+            self.style.theme_use(theme)
 
     def save_theme(self, theme):
         save_theme(theme)
@@ -68,8 +95,68 @@ class SQLitePhraseExporter:
             frame, text="Show Filter Options", command=self.toggle_filters
         )
         self.filter_btn.grid(row=2, column=0, columnspan=2, pady=5)
+        self.main_frame = frame
 
-        self.filter_frame = ttk.Frame(frame)
+        button_frame = ttk.Frame(frame)
+        button_frame.grid(row=4, column=0, columnspan=2, pady=15)
+        ttk.Button(
+            button_frame, text="Preview Export", command=self.preview_export
+        ).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Export!", command=self.perform_export).pack(
+            side="left", padx=5
+        )
+        ttk.Checkbutton(
+            button_frame,
+            text="Export on change",
+            variable=self.watch_var,
+            onvalue=1,
+            offvalue=0,
+            command=self.toggle_watch,
+        ).pack(side="left", padx=5)
+
+        self.theme_var = ttk.StringVar(value=self.style.theme.name)
+        ttk.Checkbutton(
+            frame,
+            text="Dark Mode",
+            variable=self.theme_var,
+            onvalue="darkly",
+            offvalue="flatly",
+            command=self.toggle_theme,
+        ).grid(row=5, column=0, sticky=W, pady=5)
+
+        ttk.Checkbutton(
+            frame,
+            text="Copy database into memory",
+            variable=self.snapshot_var,
+            onvalue=1,
+            offvalue=0,
+            command=self.toggle_snapshot,
+        ).grid(row=5, column=1, sticky=W, pady=5)
+
+        self.busy_bar = ttk.Progressbar(frame, mode="indeterminate")
+        self.busy_bar.grid(row=6, column=0, columnspan=2, sticky=EW, pady=(5, 0))
+        self.busy_bar.grid_remove()
+
+        self.export_frame = ttk.Frame(frame)
+        self.export_status = ttk.Label(self.export_frame, anchor="w")
+        self.export_status.grid(row=0, column=0, columnspan=2, sticky=EW)
+        self.export_progress = ttk.Progressbar(self.export_frame, mode="determinate")
+        self.export_progress.grid(row=1, column=0, sticky=EW, pady=5)
+        ttk.Button(
+            self.export_frame, text="Cancel", command=self.cancel_export
+        ).grid(row=1, column=1, padx=(5, 0))
+        self.export_frame.columnconfigure(0, weight=1)
+        self.export_frame.grid(row=7, column=0, columnspan=2, sticky=EW)
+        self.export_frame.grid_remove()
+
+        self.watch_label = ttk.Label(frame, anchor="w")
+        self.watch_label.grid(row=8, column=0, columnspan=2, sticky=EW)
+        self.watch_label.grid_remove()
+
+        frame.columnconfigure(1, weight=1)
+
+    def build_filters(self):
+        self.filter_frame = ttk.Frame(self.main_frame)
 
         ttk.Label(self.filter_frame, text="Choose a book to filter:").grid(
             row=0, column=0, sticky=W, padx=5
@@ -88,11 +175,15 @@ class SQLitePhraseExporter:
         )
         self.date_toggle_btn.grid(row=1, column=0, columnspan=2, sticky=W, padx=5)
 
-        self.date_checkbox_frame = ttk.Frame(self.date_frame)
-        self.date_checkbox_frame.grid(row=0, column=0, sticky=NW, padx=5, pady=5)
-
-        self.export_per_book_var = ttk.IntVar(value=0)
-        self.export_per_date_var = ttk.IntVar(value=0)
+        ttk.Label(self.filter_frame, text="Search lookups:").grid(
+            row=3, column=0, sticky=W, padx=5
+        )
+        ttk.Entry(self.filter_frame, textvariable=self.search_var).grid(
+            row=3, column=1, padx=5, pady=5, sticky=EW
+        )
+        self.search_label = ttk.Label(self.filter_frame, text="", anchor="w")
+        self.search_label.grid(row=4, column=1, padx=5, sticky=EW)
+        self.search_var.trace_add("write", lambda *args: self.count_search_matches())
 
         ttk.Checkbutton(
             self.filter_frame,
@@ -116,28 +207,59 @@ class SQLitePhraseExporter:
             variable=self.include_tags_var,
             onvalue=1,
             offvalue=0,
-        ).grid(row=101, column=0, columnspan=2, sticky=W, padx=5, pady=5)
+        ).grid(row=101, column=0, columnspan=2, sticky=W, padx=5, pady=(5, 0))
+
+        ttk.Checkbutton(
+            self.filter_frame,
+            text="Only export new lookups",
+            variable=self.incremental_var,
+            onvalue=1,
+            offvalue=0,
+        ).grid(row=102, column=0, columnspan=2, sticky=W, padx=5, pady=(5, 0))
+
+        ttk.Checkbutton(
+            self.filter_frame,
+            text="One entry per word",
+            variable=self.aggregate_var,
+            onvalue=1,
+            offvalue=0,
+        ).grid(row=103, column=0, columnspan=2, sticky=W, padx=5, pady=5)
 
-        button_frame = ttk.Frame(frame)
-        button_frame.grid(row=4, column=0, columnspan=2, pady=15)
         ttk.Button(
-            button_frame, text="Preview Export", command=self.preview_export
-        ).pack(side="left", padx=5)
-        ttk.Button(button_frame, text="Export!", command=self.perform_export).pack(
-            side="left", padx=5
+            self.filter_frame, text="Templates Folder", command=self.browse_templates
+        ).grid(row=104, column=0, sticky=W, padx=5, pady=5)
+        self.template_label = ttk.Label(
+            self.filter_frame, text="Default templates", anchor="w"
         )
+        self.template_label.grid(row=104, column=1, sticky=EW)
 
-        self.theme_var = ttk.StringVar(value=self.style.theme.name)
-        ttk.Checkbutton(
-            frame,
-            text="Dark Mode",
-            variable=self.theme_var,
-            onvalue="darkly",
-            offvalue="flatly",
-            command=self.toggle_theme,
-        ).grid(row=5, column=0, sticky=W, pady=5)
+        ttk.Label(self.filter_frame, text="Output format:").grid(
+            row=105, column=0, sticky=W, padx=5
+        )
+        ttk.Combobox(
+            self.filter_frame,
+            textvariable=self.format_var,
+            values=list(OUTPUT_FORMATS),
+            state="readonly",
+        ).grid(row=105, column=1, padx=5, pady=5, sticky=W)
 
-        frame.columnconfigure(1, weight=1)
+        self.populate_book_list()
+
+    def build_date_selector(self):
+        from src.date_selector import DateSelector
+
+        self.date_selector = DateSelector(
+            self.date_frame, on_change=self.populate_book_list
+        )
+        self.date_selector.grid(row=0, column=0, sticky=NW, padx=5, pady=5)
+
+    def show_busy(self, busy):
+        if busy:
+            self.busy_bar.grid()
+            self.busy_bar.start(10)
+        else:
+            self.busy_bar.stop()
+            self.busy_bar.grid_remove()
 
     def toggle_theme(self):
         theme = self.theme_var.get()
@@ -150,46 +272,46 @@ class SQLitePhraseExporter:
             self.filter_frame.grid_remove()
             self.filter_btn.config(text="Show Filter Options")
         else:
+            if self.filter_frame is None:
+                self.build_filters()
             self.filter_frame.grid(row=3, column=0, columnspan=2, sticky=EW)
             self.filter_btn.config(text="Hide Filter Options")
         self.filters_shown = not self.filters_shown
 
     def reset_filters(self):
         self.book_var.set("(All)")
-        for var in self.date_vars.values():
-            var.set(0)
-        if self.select_all_var:
-            self.select_all_var.set(0)
-        self.selected_dates_cache.clear()
-        self.select_all_checked = False
+        if self.date_selector is not None:
+            self.date_selector.clear()
         self.export_per_book_var.set(0)
         self.export_per_date_var.set(0)
         self.include_tags_var.set(1)
+        self.incremental_var.set(0)
+        self.aggregate_var.set(0)
+        self.format_var.set("Markdown")
+        self.search_var.set("")
 
-        for widget in self.date_checkbox_frame.winfo_children():
-            widget.destroy()
-        self.date_vars.clear()
-
+        self.date_filter_shown = False
         self.date_frame.grid_remove()
         self.date_toggle_btn.config(text="Show Date Filter")
 
     def toggle_date_frame(self):
-        if self.date_frame.winfo_ismapped():
-            self.selected_dates_cache = {
-                date for date, var in self.date_vars.items() if var.get() == 1
-            }
-            for var in self.date_vars.values():
-                var.set(0)
-            if self.select_all_var:
-                self.select_all_checked = self.select_all_var.get() == 1
-            else:
-                self.select_all_checked = False
+        if self.date_filter_shown:
             self.date_frame.grid_remove()
             self.date_toggle_btn.config(text="Show Date Filter")
         else:
+            if self.date_selector is None:
+                self.build_date_selector()
             self.date_frame.grid(row=2, column=0, columnspan=2, sticky="w")
             self.date_toggle_btn.config(text="Hide Date Filter")
             self.populate_date_list()
+        self.date_filter_shown = not self.date_filter_shown
+        self.populate_book_list()
+
+    def selected_dates(self):
+        # A hidden date filter keeps its selection but does not apply it.
+        if not self.date_filter_shown:
+            return []
+        return self.date_selector.selected_dates()
 
     def custom_messagebox(self, title, message, type="info"):
         top = ttk.Toplevel(self.root)
@@ -279,12 +401,23 @@ class SQLitePhraseExporter:
         self.root.wait_window(top)
 
     def browse_db(self):
-        path = filedialog.askopenfilename(filetypes=[("SQLite3 DB", "*.sqlite3 *.db")])
-        if path:
-            self.db_path = path
-            self.db_label.config(text=os.path.basename(path))
-            self.populate_date_list()
-            self.populate_book_list()
+        # Picking several databases (one per device) merges their lookups.
+        paths = filedialog.askopenfilenames(
+            filetypes=[("SQLite3 DB", "*.sqlite3 *.db")]
+        )
+        if paths:
+            if len(paths) == 1:
+                self.db_path = paths[0]
+                self.db_label.config(text=os.path.basename(paths[0]))
+            else:
+                self.db_path = list(paths)
+                self.db_label.config(
+                    text=f"{len(paths)} databases: "
+                    + ", ".join(os.path.basename(path) for path in paths)
+                )
+            self.load_catalog()
+            if self.watch_stop is not None:
+                self.start_watch(self.watch_folder_name)
         else:
             self.custom_messagebox(
                 "No File Selected",
@@ -292,6 +425,40 @@ class SQLitePhraseExporter:
                 type="warning",
             )
 
+    def toggle_snapshot(self):
+        if self.db_path:
+            self.load_catalog()
+
+    def load_catalog(self):
+        from src.catalog import Catalog
+        from src.database import get_database
+        from src.timezones import local_timezone
+
+        path = self.db_path
+        snapshot = self.snapshot_var.get() == 1
+        user_timezone = local_timezone()
+
+        def load(cancelled):
+            # Keeps the pool an export may already be using unless the mode
+            # changed or the file was replaced (see get_database).
+            get_database(path, snapshot=snapshot)
+            return Catalog.load(path, user_timezone, cancelled)
+
+        self.catalog = None
+        self.worker.submit("catalog", load, self.catalog_loaded, self.catalog_failed)
+
+    def catalog_loaded(self, catalog):
+        self.catalog = catalog
+        self.populate_date_list()
+        self.populate_book_list()
+        if self.filter_frame is not None:
+            self.count_search_matches()
+
+    def catalog_failed(self, error):
+        self.custom_messagebox(
+            "Database Error", f"Could not read the database:\n{error}", type="error"
+        )
+
     def browse_output(self):
         folder = filedialog.askdirectory()
         if folder:
@@ -304,111 +471,109 @@ class SQLitePhraseExporter:
                 type="warning",
             )
 
-    def populate_date_list(self):
-        for widget in self.date_checkbox_frame.winfo_children():
-            widget.destroy()
-        self.date_vars.clear()
+    def browse_templates(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            self.template_dir = folder
+            self.template_label.config(text=folder)
 
-        if not self.db_path:
+    def populate_date_list(self):
+        if self.date_selector is None:
+            return
+        if not self.catalog:
+            self.date_selector.set_dates({})
             return
 
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            query = """
-                SELECT DISTINCT a.create_time
-                FROM vocabulary a
-                LEFT JOIN title b ON a.title_id = b.id
-                WHERE a.create_time IS NOT NULL
-            """
-            params = []
-
-            if self.book_var.get() and self.book_var.get() != "(All)":
-                query += " AND b.name = ?"
-                params.append(self.book_var.get())
-
-            cursor.execute(query, params)
-            timestamps = [row[0] for row in cursor.fetchall()]
-            conn.close()
-
-            date_set = sorted(
-                set(
-                    datetime.fromtimestamp(ts, tz=timezone.utc)
-                    .astimezone()
-                    .date()
-                    .isoformat()
-                    for ts in timestamps
-                )
-            )
+        catalog = self.catalog
+        book = self.book_var.get()
+        self.worker.submit(
+            "dates",
+            lambda cancelled: catalog.dates(book),
+            self.date_selector.set_dates,
+            lambda e: self.custom_messagebox(
+                "Date Load Error", f"Could not load dates:\n{e}", type="error"
+            ),
+            delay=FILTER_DEBOUNCE_MS,
+        )
 
-            SCROLL_THRESHOLD = 10
+    def search_expression(self):
+        return self.search_var.get().strip() or None
 
-            if len(date_set) > SCROLL_THRESHOLD:
-                canvas = Canvas(self.date_checkbox_frame)
-                scrollbar = Scrollbar(
-                    self.date_checkbox_frame, orient="vertical", command=canvas.yview
-                )
-                scrollable_frame = Frame(canvas)
+    def count_search_matches(self):
+        # Counting the matches also builds or updates the search index in
+        # the background, so the preview or export that follows starts
+        # straight away.
+        expression = self.search_expression()
+        if not expression or not self.db_path:
+            self.search_label.config(text="")
+            return
 
-                scrollable_frame.bind(
-                    "<Configure>",
-                    lambda e: canvas.configure(scrollregion=canvas.bbox("all")),
-                )
-                canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-                canvas.configure(yscrollcommand=scrollbar.set)
+        from src.search import count_matches
+
+        path = self.db_path
+        self.worker.submit(
+            "search",
+            lambda cancelled: count_matches(path, expression, cancelled),
+            lambda matches: self.search_label.config(
+                text=f"{matches} matching lookups"
+            ),
+            lambda e: self.search_label.config(text=f"Invalid search: {e}"),
+            delay=FILTER_DEBOUNCE_MS,
+        )
 
-                canvas.pack(side="left", fill="both", expand=True)
-                scrollbar.pack(side="right", fill="y")
-                parent_frame = scrollable_frame
-            else:
-                parent_frame = self.date_checkbox_frame
-
-            self.select_all_var = ttk.IntVar(value=1 if self.select_all_checked else 0)
-            self.select_all_cb = ttk.Checkbutton(
-                parent_frame,
-                text="Select All",
-                variable=self.select_all_var,
-                onvalue=1,
-                offvalue=0,
-                command=self.toggle_all_dates,
-            )
-            self.select_all_cb.pack(anchor="w")
-
-            for d in date_set:
-                var = ttk.IntVar(value=1 if d in self.selected_dates_cache else 0)
-                cb = ttk.Checkbutton(
-                    parent_frame,
-                    text=d,
-                    variable=var,
-                    onvalue=1,
-                    offvalue=0,
-                    command=self.update_select_all_state,
-                )
-                cb.pack(anchor="w")
-                self.date_vars[d] = var
+    def preview_export(self):
+        from src.exporter import PreviewPages
+        from src.preview import show_preview
+        from src.templates import load_templates
+        from src.timezones import local_timezone
 
-        except Exception as e:
+        if not self.db_path:
             self.custom_messagebox(
-                "Date Load Error", f"Could not load dates:\n{e}", type="error"
+                "Missing Info",
+                "Please select a database.",
+                type="warning",
             )
+            return
 
-    def update_select_all_state(self):
-        if self.select_all_var is not None:
-            if all(var.get() == 1 for var in self.date_vars.values()):
-                self.select_all_var.set(1)
-                self.select_all_checked = True
-            else:
-                self.select_all_var.set(0)
-                self.select_all_checked = False
+        # Planning reads the whole database (and may update the search
+        # index), so it runs on the worker and the window opens when it is
+        # done. The settings are read here, on the Tk thread.
+        db_path = self.db_path
+        selected_dates = self.selected_dates()
+        book = self.book_var.get()
+        per_book = self.export_per_book_var.get() == 1
+        per_date = self.export_per_date_var.get() == 1
+        include_tags = self.include_tags_var.get() == 1
+        aggregate = self.aggregate_var.get() == 1
+        search = self.search_expression()
+        template_dir = self.template_dir
+        user_timezone = local_timezone()
+
+        def plan(cancelled):
+            return PreviewPages(
+                db_path,
+                selected_dates,
+                book,
+                per_book=per_book,
+                per_date=per_date,
+                user_timezone=user_timezone,
+                include_tags=include_tags,
+                templates=load_templates(template_dir),
+                aggregate=aggregate,
+                search=search,
+                cancelled=cancelled,
+            )
 
-    def toggle_all_dates(self):
-        new_value = self.select_all_var.get()
-        for var in self.date_vars.values():
-            var.set(new_value)
-        self.populate_book_list()
+        self.worker.submit(
+            "preview",
+            plan,
+            lambda pages: show_preview(pages, title="Markdown Preview"),
+            lambda e: self.custom_messagebox(
+                "Error", f"Failed to generate preview:\n{e}", type="error"
+            ),
+        )
 
-    def preview_export(self):
+    def perform_export(self):
         if not self.db_path or not self.output_dir:
             self.custom_messagebox(
                 "Missing Info",
@@ -417,172 +582,207 @@ class SQLitePhraseExporter:
             )
             return
 
-        offset_sec = -time.timezone
-        offset_hours = offset_sec / 3600
-        user_timezone = timezone(timedelta(hours=offset_hours))
-
-        output_files, error = export_phrases(
-            self.db_path,
-            self.output_dir,
-            self.date_vars,
-            self.book_var.get(),
-            self.filters_shown,
+        folder_name = self.ask_folder_name()
+        if folder_name is False:
+            return
+        self.submit_export(folder_name, self.incremental_var.get() == 1)
+
+    def ask_folder_name(self):
+        # Date-based exports that are not per book go into one folder, named
+        # by the user. Returns False if no name was given.
+        if not (
+            self.export_per_date_var.get() == 1
+            and not self.export_per_book_var.get() == 1
+            and self.format_var.get() == "Markdown"
+        ):
+            return None
+        folder_name = askstring(
+            "Folder Name", "Enter a folder name for date-based export:"
+        )
+        if not folder_name:
+            self.custom_messagebox(
+                "Missing Info",
+                "Folder name is required for date-based export.",
+                type="warning",
+            )
+            return False
+        return folder_name
+
+    def submit_export(self, folder_name, incremental):
+        from src.timezones import local_timezone
+
+        job = self.export_scheduler().submit(
+            db_path=self.db_path,
+            output_dir=self.output_dir,
+            selected_dates=self.selected_dates(),
+            book=self.book_var.get(),
+            filters_shown=self.filters_shown,
             per_book=self.export_per_book_var.get() == 1,
             per_date=self.export_per_date_var.get() == 1,
-            is_preview=True,
-            custom_folder_name=None,
-            user_timezone=user_timezone,
+            custom_folder_name=folder_name,
+            user_timezone=local_timezone(),
             include_tags=self.include_tags_var.get() == 1,
+            incremental=incremental,
+            template_dir=self.template_dir,
+            aggregate=self.aggregate_var.get() == 1,
+            output_format=OUTPUT_FORMATS[self.format_var.get()],
+            search=self.search_expression(),
         )
+        self.export_jobs[job] = self.output_dir
+        return job
 
-        if error:
-            self.custom_messagebox(
-                "Error", f"Failed to generate preview:\n{error}", type="error"
-            )
-        else:
-            combined_preview = ""
-            temp_files = []
-            for file_path in sorted(output_files):
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        combined_preview += f.read() + "\n\n"
-                    temp_files.append(file_path)
-                except Exception as e:
-                    self.custom_messagebox(
-                        "Error", f"Failed to read file {file_path}:\n{e}", type="error"
-                    )
-                    return
-
-            def cleanup_temp_files():
-                cache_dir = os.path.join(tempfile.gettempdir(), "vocab_builder_cache")
-                try:
-                    shutil.rmtree(cache_dir)
-                except Exception as e:
-                    print(f"Failed to delete cache folder {cache_dir}: {e}")
-
-            show_preview(
-                combined_preview, title="Markdown Preview", on_close=cleanup_temp_files
-            )
-
-    def perform_export(self):
+    def toggle_watch(self):
+        if self.watch_var.get() != 1:
+            self.stop_watch()
+            return
         if not self.db_path or not self.output_dir:
+            self.watch_var.set(0)
             self.custom_messagebox(
                 "Missing Info",
                 "Please select both a database and an output folder.",
                 type="warning",
             )
             return
+        folder_name = self.ask_folder_name()
+        if folder_name is False:
+            self.watch_var.set(0)
+            return
+        self.start_watch(folder_name)
+
+    def start_watch(self, folder_name):
+        # Polls the database on a background thread, which starts with an
+        # export and then exports the new lookups with the current settings
+        # each time the database changes, e.g. when the e-reader is plugged
+        # in after reading.
+        from src.watcher import DatabaseWatcher, watch
+
+        self.stop_watch()
+        stop = threading.Event()
+        watcher = DatabaseWatcher(
+            self.db_path, lambda db_path: self.watch_events.put(stop)
+        )
+        threading.Thread(target=watch, args=([watcher], stop), daemon=True).start()
+        self.watch_stop = stop
+        self.watch_folder_name = folder_name
+        self.watch_label.config(text="Waiting for the database to change...")
+        self.watch_label.grid()
+        if not self.watch_polling:
+            self.watch_polling = True
+            self.root.after(WATCH_POLL_MS, self.poll_watch)
+
+    def stop_watch(self):
+        if self.watch_stop is not None:
+            self.watch_stop.set()
+            self.watch_stop = None
+        self.watch_label.grid_remove()
+
+    def poll_watch(self):
+        try:
+            while True:
+                stop = self.watch_events.get_nowait()
+                if stop.is_set():
+                    continue
+                self.watch_jobs.add(self.submit_export(self.watch_folder_name, True))
+                self.load_catalog()
+        except queue.Empty:
+            pass
+        if self.watch_stop is None:
+            self.watch_polling = False
+            return
+        self.root.after(WATCH_POLL_MS, self.poll_watch)
+
+    def export_scheduler(self):
+        if self.scheduler is None:
+            from src.jobs import ExportScheduler
+
+            self.scheduler = ExportScheduler(self.root, self.on_export_event)
+        return self.scheduler
 
-        def export_task():
-            folder_name = None
-            if (
-                self.export_per_date_var.get() == 1
-                and not self.export_per_book_var.get() == 1
-            ):
-                folder_name = askstring(
-                    "Folder Name", "Enter a folder name for date-based export:"
+    def cancel_export(self):
+        self.scheduler.cancel()
+
+    def on_export_event(self, event):
+        kind = event["type"]
+        if kind == "queued":
+            self.export_frame.grid()
+            if self.scheduler.active_jobs() > 1:
+                self.export_status.config(
+                    text=f"{self.scheduler.active_jobs() - 1} export(s) waiting"
                 )
-                if not folder_name:
-                    self.custom_messagebox(
-                        "Missing Info",
-                        "Folder name is required for date-based export.",
-                        type="warning",
-                    )
-                    return
-
-            offset_sec = -time.timezone
-            offset_hours = offset_sec / 3600
-            user_timezone = timezone(timedelta(hours=offset_hours))
-
-            output_files, error = export_phrases(
-                self.db_path,
-                self.output_dir,
-                self.date_vars,
-                self.book_var.get(),
-                self.filters_shown,
-                per_book=self.export_per_book_var.get() == 1,
-                per_date=self.export_per_date_var.get() == 1,
-                is_preview=False,
-                custom_folder_name=folder_name,
-                user_timezone=user_timezone,
-                include_tags=self.include_tags_var.get() == 1,
+        elif kind == "started":
+            self.export_progress.config(value=0, maximum=1)
+            self.export_status.config(text="Exporting...")
+        elif kind == "progress":
+            stats = event["stats"]
+            self.export_progress.config(
+                value=stats["rows"], maximum=max(stats["total_rows"], 1)
             )
-
-            if error:
+            self.export_status.config(
+                text=f"{stats['rows']} of {stats['total_rows']} lookups, "
+                f"{stats['files']} files, {stats['bytes'] / 1024:.0f} KiB written"
+            )
+        else:
+            output_dir = self.export_jobs.pop(event["job"], self.output_dir)
+            watched = event["job"] in self.watch_jobs
+            self.watch_jobs.discard(event["job"])
+            if not self.scheduler.active_jobs():
+                self.export_frame.grid_remove()
+            if kind == "cancelled":
                 self.custom_messagebox(
-                    "Error", f"Failed to export data:\n{error}", type="error"
+                    "Export Cancelled", "The export was cancelled.", type="warning"
                 )
-            else:
-                exported_files = "\n".join(output_files)
+            elif kind == "failed":
                 self.custom_messagebox(
-                    "Success", f"Vocabulary exported to:\n{exported_files}", type="info"
+                    "Error", f"Failed to export data:\n{event['error']}", type="error"
+                )
+            elif watched:
+                # Exports on change report in the window instead of a dialog.
+                stats = event["stats"]
+                self.watch_label.config(
+                    text=f"Exported at {time.strftime('%H:%M')}: "
+                    f"{stats['written']} written, {stats['unchanged']} unchanged"
                 )
+            else:
+                self.export_finished(event["files"], event["stats"], output_dir)
+
+    def export_finished(self, output_files, stats, output_dir):
+        exported_files = "\n".join(output_files)
+        self.custom_messagebox(
+            "Success",
+            f"Vocabulary exported to:\n{exported_files}\n\n"
+            f"{stats['written']} written, {stats['unchanged']} unchanged, "
+            f"{stats['deleted']} deleted",
+            type="info",
+        )
 
-                if messagebox.askyesno(
-                    "Open Folder", "Do you want to open the output folder?"
-                ):
-                    try:
-                        if os.name == "nt":
-                            os.startfile(self.output_dir)
-                        elif os.name == "posix":
-                            subprocess.run(["xdg-open", self.output_dir], check=True)
-                    except Exception as e:
-                        self.custom_messagebox(
-                            "Error", f"Failed to open folder:\n{e}", type="error"
-                        )
-
-        threading.Thread(target=export_task).start()
-
-    def cleanup_cache(self):
-        cache_dir = os.path.join(tempfile.gettempdir(), "vocab_builder_cache")
-        if os.path.exists(cache_dir):
+        if messagebox.askyesno("Open Folder", "Do you want to open the output folder?"):
             try:
-                shutil.rmtree(cache_dir)
+                if os.name == "nt":
+                    os.startfile(output_dir)
+                elif os.name == "posix":
+                    subprocess.run(["xdg-open", output_dir], check=True)
             except Exception as e:
-                print(f"Failed to delete cache folder {cache_dir}: {e}")
+                self.custom_messagebox(
+                    "Error", f"Failed to open folder:\n{e}", type="error"
+                )
 
     def populate_book_list(self):
-        if not self.db_path:
+        if self.filter_frame is None or not self.catalog:
             return
 
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            query = """
-                SELECT DISTINCT b.name
-                FROM vocabulary a
-                LEFT JOIN title b ON a.title_id = b.id
-                WHERE b.name IS NOT NULL
-            """
-            params = []
-
-            if self.date_vars and any(
-                var.get() == 1 for var in self.date_vars.values()
-            ):
-                date_ranges = [
-                    (
-                        datetime.strptime(date_str, "%Y-%m-%d"),
-                        datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=1),
-                    )
-                    for date_str, var in self.date_vars.items()
-                    if var.get() == 1
-                ]
-                sub_filters = []
-                for start, end in date_ranges:
-                    sub_filters.append("(a.create_time >= ? AND a.create_time < ?)")
-                    params.extend([int(start.timestamp()), int(end.timestamp())])
-                query += " AND (" + " OR ".join(sub_filters) + ")"
-
-            cursor.execute(query, params)
-            books = sorted([row[0] for row in cursor.fetchall()])
-            conn.close()
-
-            self.book_dropdown["values"] = ["(All)"] + books
-            if self.book_var.get() not in books:
-                self.book_dropdown.set("(All)")
-
-        except Exception as e:
-            self.custom_messagebox(
+        catalog = self.catalog
+        selected_dates = self.selected_dates()
+        self.worker.submit(
+            "books",
+            lambda cancelled: catalog.books(selected_dates),
+            self.set_books,
+            lambda e: self.custom_messagebox(
                 "Book Load Error", f"Could not load books:\n{e}", type="error"
-            )
+            ),
+            delay=FILTER_DEBOUNCE_MS,
+        )
+
+    def set_books(self, books):
+        self.book_dropdown["values"] = ["(All)"] + books
+        if self.book_var.get() not in books:
+            self.book_dropdown.set("(All)")
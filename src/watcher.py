@@ -0,0 +1,159 @@
+import hashlib
+import os
+import time
+
+from src.database import database_paths
+from src.output_files import HASH_BLOCK_SIZE
+
+WATCH_MIN_INTERVAL = 1.0
+WATCH_MAX_INTERVAL = 30.0
+# How long a database has to stay unchanged after a write before it is
+# exported, so a sync that writes it many times triggers one export.
+SETTLE_SECONDS = 3.0
+DATABASE_NAME = "vocabulary_builder.sqlite3"
+# Where KOReader keeps its settings below a device's mount point (Kobo,
+# then Kindle and most others); anything else is found by a shallow search.
+DATABASE_LOCATIONS = (
+    os.path.join(".adds", "koreader", "settings"),
+    os.path.join("koreader", "settings"),
+    "settings",
+)
+SEARCH_DEPTH = 4
+
+
+def find_database(path):
+    # path is a database file, or a folder such as an e-reader's mount point
+    # that holds KOReader's database somewhere below it. None while it is
+    # missing, e.g. while the device is unplugged.
+    if os.path.isfile(path):
+        return path
+    if not os.path.isdir(path):
+        return None
+    for location in DATABASE_LOCATIONS:
+        candidate = os.path.join(path, location, DATABASE_NAME)
+        if os.path.isfile(candidate):
+            return candidate
+    root_depth = path.rstrip(os.sep).count(os.sep)
+    for folder, subfolders, files in os.walk(path):
+        if DATABASE_NAME in files:
+            return os.path.join(folder, DATABASE_NAME)
+        if folder.count(os.sep) - root_depth >= SEARCH_DEPTH:
+            subfolders.clear()
+        subfolders.sort()
+    return None
+
+
+def _file_states(paths):
+    # Size and mtime of each database and its write-ahead log, if any.
+    states = []
+    for path in paths:
+        for name in (path, path + "-wal"):
+            try:
+                stat = os.stat(name)
+            except FileNotFoundError:
+                states.append(None)
+                continue
+            states.append((stat.st_size, stat.st_mtime_ns))
+    return tuple(states)
+
+
+def _checksum(paths):
+    hasher = hashlib.sha256()
+    for path in paths:
+        for name in (path, path + "-wal"):
+            if not os.path.exists(name):
+                continue
+            with open(name, "rb") as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                    hasher.update(block)
+            hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+class DatabaseWatcher:
+    # Polls a database (or the several databases of a merged export, each a
+    # file or a mount point) with os.stat. While nothing changes the interval
+    # doubles up to max_interval, so an idle watch costs a stat call every
+    # half minute. A change is reported once the files have kept the same
+    # size and mtime for SETTLE_SECONDS and their checksum differs from the
+    # one last reported: a burst of writes gives one call, and a touch or a
+    # re-copy of the same data gives none. on_change receives the database
+    # path(s) in the form export_phrases takes. The first check of a present
+    # database counts as a change, so watching starts with an export.
+
+    def __init__(
+        self,
+        path,
+        on_change,
+        min_interval=WATCH_MIN_INTERVAL,
+        max_interval=WATCH_MAX_INTERVAL,
+        settle=SETTLE_SECONDS,
+    ):
+        self.path = path
+        self.watched = database_paths(path)
+        self.on_change = on_change
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.settle = settle
+        self.interval = min_interval
+        self.found = [None] * len(self.watched)
+        self.state = None
+        self.changed_at = None
+        self.pending = False
+        self.digest = None
+
+    def locate(self):
+        # Searching a mount point walks folders, so a found database is kept
+        # until it disappears.
+        for index, path in enumerate(self.watched):
+            if self.found[index] is None or not os.path.isfile(self.found[index]):
+                self.found[index] = find_database(path)
+        return list(self.found)
+
+    def check(self, now=None):
+        # One poll; returns the seconds until the next one.
+        now = time.monotonic() if now is None else now
+        files = self.locate()
+        state = None
+        if all(files):
+            state = (tuple(files), _file_states(files))
+
+        if state != self.state:
+            self.state = state
+            self.changed_at = now
+            self.pending = state is not None
+            self.interval = self.min_interval
+            return self.interval
+        if not self.pending:
+            self.interval = min(self.interval * 2, self.max_interval)
+            return self.interval
+        if now - self.changed_at < self.settle:
+            return self.min_interval
+
+        try:
+            digest = _checksum(files)
+            unchanged = _file_states(files) == state[1]
+        except OSError:
+            unchanged = False
+        if not unchanged:
+            # Written to while being read: wait for it to settle again.
+            self.state = None
+            return self.min_interval
+        self.pending = False
+        if digest != self.digest:
+            self.digest = digest
+            self.on_change(files[0] if len(files) == 1 else files)
+        return self.min_interval
+
+
+def watch(watchers, stop):
+    # Runs the watchers until stop (a threading.Event) is set, each on its
+    # own schedule. on_change runs on this thread; polling resumes when it
+    # returns.
+    due = [0.0] * len(watchers)
+    while not stop.is_set():
+        for index, watcher in enumerate(watchers):
+            if due[index] <= time.monotonic():
+                delay = watcher.check()
+                due[index] = time.monotonic() + delay
+        stop.wait(max(0.0, min(due) - time.monotonic()))
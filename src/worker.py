@@ -0,0 +1,107 @@
+import queue
+import threading
+from collections import defaultdict
+
+POLL_INTERVAL = 50
+PROGRESS_STEPS = 10000
+
+
+class Cancelled(Exception):
+    pass
+
+
+def cancellable(conn, cancelled):
+    # Lets a superseded request abort a running query: SQLite calls the
+    # handler every PROGRESS_STEPS virtual machine instructions and stops
+    # the statement with "interrupted" once it returns non-zero.
+    if cancelled is None:
+        conn.set_progress_handler(None, 0)
+    else:
+        conn.set_progress_handler(lambda: 1 if cancelled() else 0, PROGRESS_STEPS)
+
+
+class QueryWorker:
+    # Runs catalog queries on a single background thread. Requests are keyed
+    # by kind (e.g. "catalog", "dates"); a new request supersedes any queued
+    # or running one of the same kind, and can be debounced so a burst of
+    # filter changes only runs the last one. Results are handed back on the
+    # Tk thread by polling a queue with root.after.
+
+    def __init__(self, root, on_busy=None):
+        self.root = root
+        self.on_busy = on_busy
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.generations = defaultdict(int)
+        self.lock = threading.Lock()
+        self.debounced = {}
+        self.busy = 0
+
+        threading.Thread(target=self.run, daemon=True).start()
+        self.root.after(POLL_INTERVAL, self.poll)
+
+    def submit(self, kind, func, callback, error_callback=None, delay=0):
+        # func receives a cancelled() callable and runs off the Tk thread, so
+        # it must not touch widgets or Tk variables.
+        pending = self.debounced.pop(kind, None)
+        if pending is not None:
+            self.root.after_cancel(pending)
+        with self.lock:
+            self.generations[kind] += 1
+        if delay:
+            self.debounced[kind] = self.root.after(
+                delay, lambda: self.enqueue(kind, func, callback, error_callback)
+            )
+        else:
+            self.enqueue(kind, func, callback, error_callback)
+
+    def enqueue(self, kind, func, callback, error_callback):
+        self.debounced.pop(kind, None)
+        with self.lock:
+            generation = self.generations[kind]
+        self.set_busy(1)
+        self.requests.put((kind, generation, func, callback, error_callback))
+
+    def is_superseded(self, kind, generation):
+        with self.lock:
+            return self.generations[kind] != generation
+
+    def run(self):
+        # sqlite3 is only needed once a query runs, so it is imported on this
+        # thread rather than on the way to the first window paint.
+        import sqlite3
+
+        while True:
+            kind, generation, func, callback, error_callback = self.requests.get()
+            if self.is_superseded(kind, generation):
+                self.results.put((kind, generation, None, None))
+                continue
+            try:
+                result = func(lambda: self.is_superseded(kind, generation))
+                self.results.put((kind, generation, callback, result))
+            except Cancelled:
+                self.results.put((kind, generation, None, None))
+            except sqlite3.OperationalError as e:
+                if self.is_superseded(kind, generation):
+                    self.results.put((kind, generation, None, None))
+                else:
+                    self.results.put((kind, generation, error_callback, e))
+            except Exception as e:
+                self.results.put((kind, generation, error_callback, e))
+
+    def poll(self):
+        try:
+            while True:
+                kind, generation, callback, value = self.results.get_nowait()
+                self.set_busy(-1)
+                if callback is not None and not self.is_superseded(kind, generation):
+                    callback(value)
+        except queue.Empty:
+            pass
+        self.root.after(POLL_INTERVAL, self.poll)
+
+    def set_busy(self, delta):
+        was_busy = self.busy > 0
+        self.busy += delta
+        if self.on_busy and was_busy != (self.busy > 0):
+            self.on_busy(self.busy > 0)
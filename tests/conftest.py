@@ -0,0 +1,65 @@
+import os
+import sqlite3
+
+import pytest
+
+from benchmarks.synthetic_db import SCHEMA, make_database
+from src.database import close_databases
+from src.export_manifest import MANIFEST_NAME
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    # The catalog and search index caches go to a folder of the test's own,
+    # and every test starts without pooled connections.
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("LOCALAPPDATA", str(tmp_path / "cache"))
+    close_databases()
+    yield
+    close_databases()
+
+
+@pytest.fixture
+def synthetic_db(tmp_path):
+    def make(name="vocabulary.sqlite3", rows=2000, **kwargs):
+        kwargs.setdefault("days", 60)
+        kwargs.setdefault("books", 8)
+        return make_database(str(tmp_path / name), rows, **kwargs)
+
+    return make
+
+
+def empty_database(path, titles):
+    # A KOReader-shaped database with the given titles (ids from 1) and no
+    # lookups yet.
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO title (name) VALUES (?)", [(t,) for t in titles])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def add_lookups(path, lookups):
+    # lookups are (word, title_id, create_time) tuples.
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO vocabulary (word, title_id, create_time, due_time,"
+        " prev_context, next_context) VALUES (?, ?, ?, ?, 'before', 'after')",
+        [(word, title_id, when, when) for word, title_id, when in lookups],
+    )
+    conn.commit()
+    conn.close()
+
+
+def read_tree(directory):
+    # The notes in an output folder, by relative path, without the manifest.
+    notes = {}
+    for folder, _, names in os.walk(directory):
+        for name in names:
+            if name == MANIFEST_NAME:
+                continue
+            path = os.path.join(folder, name)
+            with open(path, "r", encoding="utf-8") as f:
+                notes[os.path.relpath(path, directory)] = f.read()
+    return notes
@@ -0,0 +1,28 @@
+import json
+
+from src.cli import main
+
+
+def test_missing_database_fails_before_creating_folders(tmp_path, capsys):
+    output = tmp_path / "notes"
+    assert main([str(tmp_path / "missing.sqlite3"), "-o", str(output)]) == 2
+    assert "no such database" in capsys.readouterr().err
+    assert not output.exists()
+
+
+def test_export_writes_notes(synthetic_db, tmp_path):
+    output = tmp_path / "notes"
+    assert main([synthetic_db(), "-o", str(output), "--per-book"]) == 0
+    assert len(list(output.rglob("*.md"))) > 1
+
+
+def test_malformed_manifest_jobs_are_reported(tmp_path, capsys):
+    manifest = tmp_path / "jobs.json"
+    for jobs, message in (
+        ([1], "job #1 in"),
+        ([{"db": "a.sqlite3", "output": "out", "dates": "2024-01-01"}], "'dates'"),
+        ({"jobs": {"db": "a.sqlite3"}}, "needs a list of jobs"),
+    ):
+        manifest.write_text(json.dumps(jobs))
+        assert main(["--manifest", str(manifest)]) == 2
+        assert message in capsys.readouterr().err
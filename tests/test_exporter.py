@@ -0,0 +1,125 @@
+import sqlite3
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from conftest import add_lookups, empty_database, read_tree
+from src import exporter
+from src.exporter import export_phrases
+
+TIMEZONE = ZoneInfo("Europe/Berlin")
+
+
+def export(db_path, output_dir, book=None, **options):
+    stats = {}
+    files, error = export_phrases(
+        db_path,
+        str(output_dir),
+        [],
+        book,
+        True,
+        user_timezone=TIMEZONE,
+        stats=stats,
+        **options,
+    )
+    assert error is None
+    return stats
+
+
+def last_time(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT MAX(create_time) FROM vocabulary").fetchone()[0]
+    finally:
+        conn.close()
+
+
+# Files holding several books get new lookups appended under a new book
+# header rather than in their book's place, so only per-book files match a
+# full export exactly.
+@pytest.mark.parametrize("per_date", [False, True])
+def test_incremental_export_matches_full_export(synthetic_db, tmp_path, per_date):
+    db_path = synthetic_db(rows=500)
+    options = {"per_book": True, "per_date": per_date}
+    export(db_path, tmp_path / "incremental", incremental=True, **options)
+
+    # New lookups in books with earlier ones, on the last day and a new one.
+    later = last_time(db_path)
+    add_lookups(
+        db_path,
+        [
+            ("appended1", 1, later + 60),
+            ("appended2", 2, later + 120),
+            ("appended3", 1, later + 86400),
+        ],
+    )
+    stats = export(db_path, tmp_path / "incremental", incremental=True, **options)
+    assert stats["rows"] == 3
+    export(db_path, tmp_path / "full", **options)
+    assert read_tree(tmp_path / "incremental") == read_tree(tmp_path / "full")
+
+
+def test_parallel_export_matches_serial_export(synthetic_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(exporter, "PARALLEL_MIN_FILES", 2)
+    monkeypatch.setattr(exporter, "PARALLEL_MIN_ROWS", 1)
+    db_path = synthetic_db(rows=1500)
+    for grouping in ({"per_book": True}, {"per_date": True}):
+        grouping["custom_folder_name"] = "Days"
+        name = "-".join(grouping)
+        serial = export(db_path, tmp_path / f"serial-{name}", workers=1, **grouping)
+        parallel = export(
+            db_path, tmp_path / f"parallel-{name}", workers=2, **grouping
+        )
+        assert parallel["files"] == serial["files"] > 2
+        assert read_tree(tmp_path / f"parallel-{name}") == read_tree(
+            tmp_path / f"serial-{name}"
+        )
+
+
+def test_merged_databases_drop_lookups_synced_to_both(tmp_path):
+    when = 1_600_000_000
+    first = empty_database(str(tmp_path / "reader.sqlite3"), ["The Book"])
+    second = empty_database(str(tmp_path / "phone.sqlite3"), [" the book "])
+    add_lookups(first, [("shared", 1, when), ("reader", 1, when + 600)])
+    # The same lookup synced to the phone a little later, and one made only
+    # there.
+    add_lookups(second, [("shared", 1, when + 30), ("phone", 1, when + 900)])
+
+    stats = export([first, second], tmp_path / "out")
+    assert stats["rows"] == 3
+    (note,) = read_tree(tmp_path / "out").values()
+    assert note.count("==shared==") == 1
+    assert "==reader==" in note and "==phone==" in note
+
+
+def test_incremental_export_after_a_word_is_looked_up_again(synthetic_db, tmp_path):
+    db_path = synthetic_db(rows=500)
+    options = {"per_book": True, "per_date": True}
+    export(db_path, tmp_path / "incremental", incremental=True, **options)
+
+    # KOReader keeps the row of a word looked up again, with a new time and
+    # context.
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "UPDATE vocabulary SET create_time = ?, prev_context = 'again'"
+        " WHERE rowid = 10",
+        (last_time(db_path) + 86400,),
+    )
+    conn.commit()
+    conn.close()
+    export(db_path, tmp_path / "incremental", incremental=True, **options)
+    export(db_path, tmp_path / "full", **options)
+    assert read_tree(tmp_path / "incremental") == read_tree(tmp_path / "full")
+
+
+def test_filtered_incremental_export_only_appends(synthetic_db, tmp_path):
+    # Lookups of other books are newer than the mark and older by rowid,
+    # but were never exported, so they do not force a full export.
+    db_path = synthetic_db(rows=500)
+    conn = sqlite3.connect(db_path)
+    (book,) = conn.execute("SELECT name FROM title WHERE id = 4").fetchone()
+    conn.close()
+    options = {"book": book, "per_book": True, "incremental": True}
+    export(db_path, tmp_path / "out", **options)
+    add_lookups(db_path, [("appended", 4, last_time(db_path) + 60)])
+    assert export(db_path, tmp_path / "out", **options)["rows"] == 1
@@ -0,0 +1,41 @@
+from zoneinfo import ZoneInfo
+
+from conftest import add_lookups, empty_database
+from src.database import get_database
+from src.exporter import PreviewPages
+
+TIMEZONE = ZoneInfo("Europe/Berlin")
+
+
+def test_searched_page_renders_on_another_pooled_connection(synthetic_db):
+    db_path = synthetic_db()
+    pages = PreviewPages(db_path, [], None, user_timezone=TIMEZONE, search="garden")
+    assert pages.total_entries > 0
+    # With the planning connection checked out, the page gets a new one.
+    with get_database(db_path).connect():
+        page = pages.render(0, 0, 5)
+    assert page.count("> [!note]") == 5
+
+
+def test_per_date_pages_hold_the_lookups_counted_for_them(tmp_path):
+    # St. John's set its clocks back from 00:01 to 23:01 on 2008-11-02, so
+    # the lookups of the repeated hour belong to the day before.
+    transition = 1225593060
+    db_path = empty_database(str(tmp_path / "vocabulary.sqlite3"), ["The Book"])
+    add_lookups(
+        db_path,
+        [
+            (f"word{n}", 1, when)
+            for n, when in enumerate(range(transition - 7200, transition + 7200, 300))
+        ],
+    )
+    pages = PreviewPages(
+        db_path, [], None, per_date=True, user_timezone=ZoneInfo("America/St_Johns")
+    )
+    assert [group["dates"] for group in pages.groups] == [
+        ("2008-11-01",),
+        ("2008-11-02",),
+    ]
+    for index, group in enumerate(pages.groups):
+        page = pages.render(index, 0, 1000)
+        assert page.count("> [!note]") == group["count"]
@@ -0,0 +1,30 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks import startup
+
+pytest.importorskip("ttkbootstrap")
+
+
+def test_ui_leaves_heavy_modules_to_first_use():
+    # In a fresh interpreter, as the app starts.
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import json, sys, src.ui; print(json.dumps(sorted(sys.modules)))",
+        ],
+        cwd=startup.ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    loaded = set(json.loads(result.stdout))
+    assert not loaded & set(startup.LAZY_MODULES)
+
+
+def test_startup_within_import_budget():
+    assert startup.main(["--no-paint"]) == 0
@@ -0,0 +1,80 @@
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from src.filters import build_date_filter
+from src.timezones import DayBuckets, local_date, offset_segments
+
+# Berlin changes its offset at 02:00/03:00; Havana skips midnight in spring,
+# and St. John's repeated the hour after midnight in autumn until 2011.
+ZONES = [
+    ("Europe/Berlin", 2021),
+    ("America/Havana", 2012),
+    ("America/St_Johns", 2008),
+]
+
+
+def sample_times(user_timezone, year):
+    # Every 7 minutes of the year, and every 13 seconds around each of its
+    # transitions.
+    start = int(datetime(year, 1, 1, tzinfo=timezone.utc).timestamp())
+    end = start + 366 * 86400
+    times = list(range(start, end, 2220))
+    for transition, _ in offset_segments(user_timezone, start, end)[1:]:
+        times.extend(range(transition - 7200, transition + 7200, 13))
+    return start, end, sorted(times)
+
+
+@pytest.mark.parametrize("zone, year", ZONES)
+def test_day_buckets_match_zoneinfo_and_sql(zone, year):
+    user_timezone = ZoneInfo(zone)
+    start, end, times = sample_times(user_timezone, year)
+    buckets = DayBuckets(user_timezone, start, end)
+    assert len(buckets.segments) > 1
+
+    expected = [local_date(t, user_timezone).isoformat() for t in times]
+    assert buckets.days(times) == expected
+    assert [buckets.day(t) for t in times] == expected
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE v (create_time INTEGER)")
+    conn.executemany("INSERT INTO v VALUES (?)", [(t,) for t in times])
+    numbers = conn.execute(
+        f"SELECT {buckets.sql('create_time')} FROM v ORDER BY rowid"
+    ).fetchall()
+    assert [buckets.name(n) for (n,) in numbers] == expected
+
+
+def test_day_buckets_within_a_repeated_hour():
+    # All lookups fall in the hour St. John's repeated after midnight.
+    user_timezone = ZoneInfo("America/St_Johns")
+    start, end, _ = sample_times(user_timezone, 2008)
+    transition = offset_segments(user_timezone, start, end)[-1][0]
+    buckets = DayBuckets(user_timezone, transition + 10, transition + 20)
+    assert buckets.day(transition + 15) == local_date(
+        transition + 15, user_timezone
+    ).isoformat()
+
+
+@pytest.mark.parametrize("zone, year", ZONES[:2])
+def test_date_filter_selects_local_days(zone, year):
+    user_timezone = ZoneInfo(zone)
+    _, _, times = sample_times(user_timezone, year)
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE a (create_time INTEGER)")
+    conn.executemany("INSERT INTO a VALUES (?)", [(t,) for t in times])
+    local = {t: local_date(t, user_timezone).isoformat() for t in times}
+
+    first = date(year, 1, 1)
+    for selected in (
+        [(first + timedelta(days=n)).isoformat() for n in range(0, 366, 3)],
+        [(first + timedelta(days=n)).isoformat() for n in range(60, 120)],
+    ):
+        condition, params = build_date_filter(selected, user_timezone)
+        rows = conn.execute(
+            f"SELECT create_time FROM a WHERE {condition}", params
+        ).fetchall()
+        chosen = set(selected)
+        assert {t for (t,) in rows} == {t for t in times if local[t] in chosen}